@@ -1,97 +1,1105 @@
+import io
 import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import tempfile
+import zlib
+import pickle
+import weakref
+import sqlite3
+import signal
+import threading
+import hmac
+import hashlib
 import logging
-import requests
+import heapq
+import asyncio
+import itertools
+import multiprocessing
+import importlib.util
+import httpx
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.patches import Patch
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, InputFile
+from telegram.error import BadRequest, RetryAfter
+from telegram.ext import ApplicationBuilder, BasePersistence, BaseRateLimiter, BaseUpdateProcessor, PersistenceInput, TypeHandler, CommandHandler, CallbackQueryHandler, MessageHandler, filters, ContextTypes
 from bs4 import BeautifulSoup
+from html.parser import HTMLParser
 from datetime import datetime
+from collections import OrderedDict
+from contextlib import asynccontextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
-from openpyxl import Workbook
 
 # ------------------ CONFIGURATION ------------------
 load_dotenv()
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL")
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "1000"))
+UPDATE_CONCURRENCY = int(os.getenv("UPDATE_CONCURRENCY", "64"))
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+TELEGRAM_CHAT_RATE = float(os.getenv("TELEGRAM_CHAT_RATE", "1"))
+TELEGRAM_CHAT_BURST = int(os.getenv("TELEGRAM_CHAT_BURST", "3"))
+TELEGRAM_GROUP_RATE = float(os.getenv("TELEGRAM_GROUP_RATE", str(20 / 60)))
+TELEGRAM_UPLOAD_CONCURRENCY = int(os.getenv("TELEGRAM_UPLOAD_CONCURRENCY", "4"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+TASKS_PER_PAGE = int(os.getenv("TASKS_PER_PAGE", "20"))
+KEYBOARD_EDIT_DELAY = float(os.getenv("KEYBOARD_EDIT_DELAY", "0.4"))
+BOARD_PROGRESS_INTERVAL = float(os.getenv("BOARD_PROGRESS_INTERVAL", "1"))
+KEYBOARD_EDIT_CACHE = int(os.getenv("KEYBOARD_EDIT_CACHE", "10000"))
+MIRO_API_URL = os.getenv("MIRO_API_URL", "https://api.miro.com/v2")
+MIRO_TIMEOUT = float(os.getenv("MIRO_TIMEOUT", "15"))
+MIRO_CONNECT_TIMEOUT = float(os.getenv("MIRO_CONNECT_TIMEOUT", "5"))
+MIRO_MAX_CONNECTIONS = int(os.getenv("MIRO_MAX_CONNECTIONS", "50"))
+MIRO_PAGE_SIZE = int(os.getenv("MIRO_PAGE_SIZE", "50"))
+MIRO_REQUEST_COST = int(os.getenv("MIRO_REQUEST_COST", "50"))
+MIRO_MAX_RETRIES = int(os.getenv("MIRO_MAX_RETRIES", "4"))
+MIRO_RETRY_BASE = float(os.getenv("MIRO_RETRY_BASE", "0.5"))
+MIRO_RETRY_CAP = float(os.getenv("MIRO_RETRY_CAP", "30"))
+NOTE_DATE_FORMAT = os.getenv("NOTE_DATE_FORMAT", "%Y-%m-%d")
+BOARD_CACHE_SIZE = int(os.getenv("BOARD_CACHE_SIZE", "128"))
+BOARD_CACHE_TTL = float(os.getenv("BOARD_CACHE_TTL", "30"))
+BOARD_CACHE_MAX_AGE = float(os.getenv("BOARD_CACHE_MAX_AGE", "3600"))
+MIRO_WEBHOOK_PATH = os.getenv("MIRO_WEBHOOK_PATH", "/miro")
+MIRO_WEBHOOK_SECRET = os.getenv("MIRO_WEBHOOK_SECRET")
+MIRO_WEBHOOK_PORT = int(os.getenv("MIRO_WEBHOOK_PORT", "0"))
+MIRO_WEBHOOK_TTL = float(os.getenv("MIRO_WEBHOOK_TTL", "600"))
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(min(4, os.cpu_count() or 1))))
+RENDER_QUEUE_LIMIT = int(os.getenv("RENDER_QUEUE_LIMIT", "32"))
+CHART_MAX_INCHES = float(os.getenv("CHART_MAX_INCHES", "300"))
+CHART_LABEL_LIMIT = int(os.getenv("CHART_LABEL_LIMIT", "300"))
+CHART_MIN_FONTSIZE = 3
+OUTPUT_SPILL_BYTES = int(os.getenv("OUTPUT_SPILL_BYTES", str(20 * 1024 * 1024)))
+CHART_STYLE_VERSION = "2"
+RENDER_CACHE_BYTES = int(os.getenv("RENDER_CACHE_BYTES", str(64 * 1024 * 1024)))
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR")
+RENDER_CACHE_DISK_BYTES = int(os.getenv("RENDER_CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", "bot_state.sqlite3")
+SESSION_WRITE_RETRIES = int(os.getenv("SESSION_WRITE_RETRIES", "5"))
+SESSION_FLUSH_DELAY = float(os.getenv("SESSION_FLUSH_DELAY", "1"))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
 
 # ------------------ LOGGER SETUP ------------------
 logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)
 logger = logging.getLogger(__name__)
 
 # ------------------ FETCHING DATA ------------------
-def fetch_sticky_notes(board_id, headers):
-    url = f"https://api.miro.com/v2/boards/{board_id}/items?type=sticky_note"
-    response = requests.get(url, headers=headers)
-    if response.status_code == 200:
-        return response.json().get("data", [])
-    logger.error(f"Gagal ambil data dari Miro: {response.status_code} {response.text}")
-    return []
-
-def parse_note(note):
+def single_flight(inflight, key, start):
+    # Pemanggil dengan key yang sama menunggu satu task bersama; shield supaya pembatalan
+    # satu pemanggil tidak ikut membatalkan pekerjaan untuk pemanggil lain
+    task = inflight.get(key)
+    if task is None:
+        task = inflight[key] = asyncio.ensure_future(start())
+        task.add_done_callback(lambda done: _finish_flight(inflight, key, done))
+    return asyncio.shield(task)
+
+def _finish_flight(inflight, key, task):
+    if inflight.get(key) is task:
+        del inflight[key]
+    if not task.cancelled():
+        task.exception()
+
+class MiroRateBudget:
+    # Kredit rate limit Miro per token, diisi dari header X-RateLimit-* setiap response
+    def __init__(self):
+        self.remaining = None
+        self.reset_at = 0.0
+        self.blocked_until = 0.0
+        # None = belum ada response; False = server tidak mengirim header rate limit, tidak ada kuota yang dijaga
+        self.limited = None
+        self._probe = None
+        self.active = 0
+
+    @property
+    def idle(self):
+        # Tidak ada request yang memakainya dan jendela kuota/blokirnya sudah lewat: aman dibuang
+        now = time.time()
+        return not self.active and self._probe is None and now >= self.reset_at and now >= self.blocked_until
+
+    def delay(self, cost):
+        now = time.time()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if now >= self.reset_at:
+            self.remaining = None
+        elif self.remaining is not None and self.remaining < cost:
+            return self.reset_at - now
+        return 0
+
+    async def acquire(self, cost):
+        while True:
+            # Selama sisa kuota belum diketahui, hanya satu request yang jalan untuk membaca header
+            if self.remaining is None and self.limited is not False and self._probe is not None:
+                await self._probe.wait()
+                continue
+            wait = self.delay(cost)
+            if not wait:
+                break
+            logger.info(f"Kuota Miro habis, menunggu {wait:.1f} detik")
+            await asyncio.sleep(wait)
+        if self.remaining is not None:
+            self.remaining -= cost
+        elif self.limited is not False:
+            self._probe = asyncio.Event()
+
+    def release(self):
+        if self._probe is not None:
+            self._probe.set()
+            self._probe = None
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.time() + seconds)
+
+    def update(self, headers):
+        try:
+            remaining = int(headers["X-RateLimit-Remaining"])
+            reset_at = float(headers["X-RateLimit-Reset"])
+        except (KeyError, ValueError):
+            if self.limited is None:
+                self.limited = False
+            return
+        self.limited = True
+        # Response yang datang terlambat membawa angka lama; dalam jendela yang sama pakai yang terkecil
+        if reset_at == self.reset_at and self.remaining is not None:
+            remaining = min(remaining, self.remaining)
+        self.remaining, self.reset_at = remaining, reset_at
+
+class MiroClient:
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, base_url=MIRO_API_URL, timeout=MIRO_TIMEOUT, connect_timeout=MIRO_CONNECT_TIMEOUT,
+                 max_connections=MIRO_MAX_CONNECTIONS, request_cost=MIRO_REQUEST_COST, max_retries=MIRO_MAX_RETRIES,
+                 retry_base=MIRO_RETRY_BASE, retry_cap=MIRO_RETRY_CAP, max_budgets=10000):
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.request_cost = request_cost
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        self.max_budgets = max_budgets
+        self._client = None
+        self._budgets = {}
+        self._inflight = {}
+
+    @property
+    def client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout, limits=self.limits)
+        return self._client
+
+    @staticmethod
+    def token_key(headers):
+        return hashlib.sha256(headers.get("Authorization", "").encode()).hexdigest()
+
+    async def get(self, path, headers, params=None):
+        # GET yang identik dan sedang berjalan dipakai bersama, bukan dikirim ulang
+        key = (self.token_key(headers), path, tuple(sorted((params or {}).items())))
+        return await single_flight(self._inflight, key, lambda: self._get_with_retry(key[0], path, headers, params))
+
+    def budget(self, token_key):
+        budget = self._budgets.get(token_key)
+        if budget is None:
+            # Satu budget per token (per user); yang sudah menganggur dibuang supaya dict tidak tumbuh terus
+            if len(self._budgets) >= self.max_budgets:
+                self._budgets = {key: b for key, b in self._budgets.items() if not b.idle}
+            budget = self._budgets[token_key] = MiroRateBudget()
+        return budget
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.retry_cap, self.retry_base * 2 ** attempt))
+
+    async def _get_with_retry(self, token_key, path, headers, params):
+        budget = self.budget(token_key)
+        budget.active += 1
+        try:
+            for attempt in range(self.max_retries + 1):
+                await budget.acquire(self.request_cost)
+                try:
+                    response = await self.client.get(path, headers=headers, params=params)
+                    budget.update(response.headers)
+                except httpx.TransportError:
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(self.backoff(attempt))
+                    continue
+                finally:
+                    budget.release()
+                if response.status_code not in self.RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+
+                try:
+                    delay = float(response.headers["Retry-After"]) + random.uniform(0, self.retry_base)
+                except (KeyError, ValueError):
+                    delay = self.backoff(attempt)
+                if response.status_code == 429:
+                    # Semua request dengan token yang sama ikut menunggu
+                    budget.block(delay)
+                logger.warning(f"Miro {response.status_code} untuk {path}, coba lagi dalam {delay:.1f} detik")
+                await asyncio.sleep(delay)
+        finally:
+            budget.active -= 1
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+miro_client = MiroClient()
+
+class MiroAPIError(Exception):
+    pass
+
+async def iter_sticky_note_pages(board_id, headers, page_size=MIRO_PAGE_SIZE):
+    params = {"type": "sticky_note", "limit": page_size}
+    while True:
+        try:
+            response = await miro_client.get(f"/boards/{board_id}/items", headers, params=params)
+        except httpx.HTTPError as e:
+            raise MiroAPIError(f"Gagal menghubungi Miro: {e!r}") from e
+        if response.status_code != 200:
+            raise MiroAPIError(f"Gagal ambil data dari Miro: {response.status_code} {response.text}")
+        body = response.json()
+        yield body.get("data", [])
+        cursor = body.get("cursor")
+        if not cursor:
+            return
+        params = {**params, "cursor": cursor}
+
+# ------------------ TASK TABLE ------------------
+class TaskTable:
+    COLUMNS = ("ids", "task", "start", "end", "person", "color", "modified")
+    # Tanggal disimpan sebagai jumlah hari sejak 1970-01-01 (int32), cukup untuk chart per hari
+    DATE_COLUMNS = ("start", "end")
+    __slots__ = (*COLUMNS, "errors", "_rows", "__weakref__")
+
+    # Tabel hasil unpickle dengan isi yang sama dipakai bersama antar sesi
+    _shared = weakref.WeakValueDictionary()
+
+    def __init__(self, errors=None, **columns):
+        for name in self.COLUMNS:
+            dtype = np.int32 if name in self.DATE_COLUMNS else object
+            values = columns.get(name, ())
+            column = np.empty(len(values), dtype=dtype)
+            column[:] = values
+            setattr(self, name, column)
+        self.errors = errors or []
+        self._rows = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __reduce__(self):
+        return TaskTable._restore, ({name: getattr(self, name) for name in (*self.COLUMNS, "errors")},)
+
+    @classmethod
+    def _restore(cls, state):
+        digest = hashlib.sha256(pickle.dumps((state["ids"], state["modified"], state["errors"]))).digest()
+        table = cls._shared.get(digest)
+        if table is None:
+            table = cls._shared[digest] = cls(**state)
+        return table
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = {item_id: row for row, item_id in enumerate(self.ids)}
+        return self._rows
+
+    def take(self, rows):
+        rows = np.asarray(rows, dtype=np.intp)
+        return TaskTable(**{name: getattr(self, name)[rows] for name in self.COLUMNS})
+
+    @classmethod
+    def concat(cls, tables, errors=None):
+        tables = list(tables)
+        if not tables:
+            return cls(errors=errors)
+        return cls(errors=errors, **{name: np.concatenate([getattr(t, name) for t in tables]) for name in cls.COLUMNS})
+
+    def to_frame(self, types):
+        start, end = (column.astype("datetime64[D]").astype("datetime64[ns]") for column in (self.start, self.end))
+        return pd.DataFrame({"Task": self.task, "Start": start, "End": end,
+                             "Person": self.person, "Type": types})
+
+class TaskSelection:
+    TYPES = ("Critical Path", "Floating Task")
+    __slots__ = ("codes",)
+
+    def __init__(self, size=0):
+        # Satu byte per baris TaskTable: 0 = belum dipilih, n = TYPES[n - 1]
+        self.codes = bytearray(size)
+
+    def type_of(self, row):
+        code = self.codes[row]
+        return self.TYPES[code - 1] if code else None
+
+    def toggle(self, row, tipe):
+        code = self.TYPES.index(tipe) + 1
+        self.codes[row] = 0 if self.codes[row] == code else code
+
+    def rows(self, tipe):
+        return np.flatnonzero(np.frombuffer(self.codes, dtype=np.uint8) == self.TYPES.index(tipe) + 1)
+
+    def clear(self):
+        self.codes = bytearray(len(self.codes))
+
+    def merged(self, base, theirs):
+        # Baris yang diubah sejak base ditimpakan ke pilihan versi lain
+        if not isinstance(base, TaskSelection) or not isinstance(theirs, TaskSelection) or \
+                not len(base.codes) == len(theirs.codes) == len(self.codes):
+            return self
+        merged = TaskSelection()
+        merged.codes = bytearray(theirs.codes)
+        for row, (old, new) in enumerate(zip(base.codes, self.codes)):
+            if old != new:
+                merged.codes[row] = new
+        return merged
+
+    def remap(self, old, new):
+        # Pilihan mengikuti item id Miro, jadi tetap berlaku setelah board di-refresh
+        codes = bytearray(len(new))
+        for row, item_id in enumerate(new.ids):
+            old_row = old.rows.get(item_id)
+            if old_row is not None and old_row < len(self.codes):
+                codes[row] = self.codes[old_row]
+        self.codes = codes
+
+# ------------------ NOTE PARSING ------------------
+NOTE_INLINE_TAGS = {"span", "strong", "b", "em", "i", "u", "s", "a"}
+NOTE_BLOCK_TAGS = {"p"}
+NOTE_VOID_TAGS = {"br"}
+
+class NoteContentParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.open_tags = []
+        self.tag_count = 0
+        self.unsupported = False
+
+    def handle_starttag(self, tag, attrs):
+        self.tag_count += 1
+        if tag in NOTE_VOID_TAGS:
+            return
+        if tag in NOTE_INLINE_TAGS or tag in NOTE_BLOCK_TAGS and not self.open_tags:
+            self.open_tags.append(tag)
+        else:
+            self.unsupported = True
+
+    def handle_startendtag(self, tag, attrs):
+        self.tag_count += 1
+        if tag not in NOTE_VOID_TAGS:
+            self.unsupported = True
+
+    def handle_endtag(self, tag):
+        self.tag_count += 1
+        if tag in NOTE_VOID_TAGS:
+            return
+        if self.open_tags and self.open_tags[-1] == tag:
+            self.open_tags.pop()
+        else:
+            self.unsupported = True
+
+    def handle_data(self, data):
+        # lxml membuang/menyusutkan whitespace di luar elemen dan node yang isinya hanya whitespace,
+        # serta menormalkan "\r"; serahkan ke BeautifulSoup
+        if "\r" in data or data.isspace() or (not self.open_tags or self.open_tags[0] not in NOTE_BLOCK_TAGS) and (
+                data[:1].isspace() or data[-1:].isspace()):
+            self.unsupported = True
+        self.parts.append(data)
+
+    def handle_comment(self, data):
+        self.unsupported = True
+
+    def handle_decl(self, decl):
+        self.unsupported = True
+
+    def handle_pi(self, data):
+        self.unsupported = True
+
+    def unknown_decl(self, data):
+        self.unsupported = True
+
+def note_content_text(content):
+    if "<" not in content and "&" not in content and "\r" not in content and not content[:1].isspace():
+        return content
+    parser = NoteContentParser()
     try:
-        content = note["data"].get("content", "")
-        color = note.get("style", {}).get("fillColor", "")
-        clean = BeautifulSoup(content, "lxml").get_text()
+        parser.feed(content)
+        parser.close()
+    except Exception:
+        parser.unsupported = True
+    # "<" yang bukan awal tag dibaca HTMLParser sebagai teks, sedangkan lxml membuangnya
+    if parser.unsupported or parser.tag_count != content.count("<"):
+        return BeautifulSoup(content, "lxml").get_text()
+    return "".join(parser.parts)
+
+def parse_note_dates(values):
+    values = pd.Series(values, dtype=object)
+    dates = pd.to_datetime(values, format=NOTE_DATE_FORMAT, errors="coerce", cache=True)
+    missing = dates.isna()
+    if missing.any():
+        # Format tanggal lain tetap diterima, tapi hanya untuk baris yang gagal di format utama
+        dates[missing] = [parse_note_date(value) for value in values[missing]]
+    return dates.to_numpy(dtype="datetime64[D]")
+
+def parse_note_date(value):
+    try:
+        date = pd.Timestamp(value)
+    except (ValueError, TypeError, OverflowError):
+        return pd.NaT
+    # Tanggal dengan zona waktu dipakai apa adanya (tanggal lokal di note), tanpa konversi ke UTC
+    return date.tz_localize(None) if date is not pd.NaT and date.tzinfo else date
+
+def parse_notes_batch(items):
+    ids, modified, fields, colors, errors = [], [], [], [], []
+    for note in items:
+        item_id, item_modified = note.get("id"), note.get("modifiedAt")
+        try:
+            clean = note_content_text(note["data"].get("content", ""))
+            color = (note.get("style") or {}).get("fillColor", "")
+        except Exception as e:
+            errors.append((item_id, item_modified, f"konten tidak terbaca: {e}"))
+            continue
         parts = [x.strip() for x in clean.split("|")]
         if len(parts) != 4:
+            errors.append((item_id, item_modified, f"butuh 4 kolom dipisah '|', ditemukan {len(parts)}"))
+            continue
+        ids.append(item_id)
+        modified.append(item_modified)
+        parts[3] = sys.intern(parts[3])
+        fields.append(parts)
+        colors.append(color)
+
+    task, start, end, person = zip(*fields) if fields else ((), (), (), ())
+    start, end = parse_note_dates(start), parse_note_dates(end)
+    invalid = np.isnat(start) | np.isnat(end)
+    for row in np.flatnonzero(invalid):
+        column, value = ("Start", fields[row][1]) if np.isnat(start[row]) else ("End", fields[row][2])
+        errors.append((ids[row], modified[row], f"tanggal {column} tidak valid: {value!r}"))
+
+    start, end = (np.where(invalid, 0, dates.view(np.int64)).astype(np.int32) for dates in (start, end))
+    table = TaskTable(ids=ids, task=task, start=start, end=end, person=person, color=colors, modified=modified)
+    return table.take(np.flatnonzero(~invalid)) if invalid.any() else table, errors
+
+# ------------------ BOARD CACHE ------------------
+class BoardCacheEntry:
+    def __init__(self, table):
+        self.table = table
+        self.fetched_at = self.used_at = time.monotonic()
+
+class BoardCache:
+    def __init__(self, max_size=BOARD_CACHE_SIZE, ttl=BOARD_CACHE_TTL, max_age=BOARD_CACHE_MAX_AGE,
+                 subscribed_ttl=MIRO_WEBHOOK_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_age = max_age
+        self.subscribed_ttl = subscribed_ttl
+        self._entries = OrderedDict()
+        self.loading = {}
+        # Board yang mengirim event webhook tidak perlu di-poll tiap TTL pendek
+        self.subscribed = set()
+        self.missed_events = {}
+        # Jumlah sticky note yang sudah diambil oleh fetch yang sedang berjalan, untuk pesan progres /gantt
+        self.progress = {}
+
+    @staticmethod
+    def key(miro_token, board_id):
+        return hashlib.sha256(miro_token.encode()).hexdigest(), board_id
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
             return None
-        return dict(zip(["Task", "Start", "End", "Person"], parts))
-    except Exception as e:
-        logger.warning(f"Parse error: {e}")
-        return None
+        if time.monotonic() - entry.used_at > self.max_age:
+            del self._entries[key]
+            return None
+        entry.used_at = time.monotonic()
+        self._entries.move_to_end(key)
+        return entry
+
+    def is_fresh(self, key, entry):
+        ttl = self.subscribed_ttl if key[1] in self.subscribed else self.ttl
+        return time.monotonic() - entry.fetched_at <= ttl
+
+    def board_entries(self, board_id):
+        return [(key, entry) for key, entry in self._entries.items() if key[1] == board_id]
+
+    def put(self, key, table):
+        self._entries[key] = entry = BoardCacheEntry(table)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return entry
+
+board_cache = BoardCache()
+
+class BoardSync:
+    def __init__(self, previous=None):
+        self.previous = previous if previous is not None else TaskTable()
+        self.previous_errors = {error[0]: error for error in self.previous.errors}
+        self.pages, self.errors, self.seen = [], [], set()
+        self.added = self.modified = 0
+
+    def feed(self, page):
+        reused, changed = [], []
+        for raw in page:
+            item_id, modified = raw.get("id"), raw.get("modifiedAt")
+            self.seen.add(item_id)
+            row = self.previous.rows.get(item_id)
+            error = self.previous_errors.get(item_id)
+            if modified and row is not None and self.previous.modified[row] == modified:
+                reused.append(row)
+            elif modified and error and error[1] == modified:
+                self.errors.append(error)
+            else:
+                if row is None and error is None:
+                    self.added += 1
+                else:
+                    self.modified += 1
+                changed.append(raw)
+
+        parsed, errors = parse_notes_batch(changed)
+        self.errors.extend(errors)
+        table = TaskTable.concat([self.previous.take(reused), parsed])
+        # Kembalikan ke urutan board
+        order = [table.rows[raw.get("id")] for raw in page if raw.get("id") in table.rows]
+        self.pages.append(table.take(order))
+
+    @property
+    def removed(self):
+        return [item_id for item_id in [*self.previous.ids, *self.previous_errors] if item_id not in self.seen]
+
+    def result(self):
+        return TaskTable.concat(self.pages, errors=self.errors)
+
+async def load_board_notes(miro_token, board_id, headers):
+    key = BoardCache.key(miro_token, board_id)
+    entry = board_cache.get(key)
+    if entry and board_cache.is_fresh(key, entry):
+        return entry.table
+    # Satu fetch+parse per board untuk semua user yang menjalankan /gantt bersamaan
+    return await single_flight(board_cache.loading, key, lambda: refresh_board(key, board_id, headers, entry))
+
+async def refresh_board(key, board_id, headers, entry):
+    sync = BoardSync(entry.table if entry else None)
+    stale = False
+    board_cache.progress[key] = 0
+    try:
+        async for page in iter_sticky_note_pages(board_id, headers):
+            sync.feed(page)
+            board_cache.progress[key] += len(page)
+        table = sync.result()
+        # Event webhook yang datang selama fetch mungkin belum terlihat di halaman yang sudah diambil
+        for event_type, item in board_cache.missed_events.get(key, ()):
+            if is_patchable_event(event_type, item):
+                table = patch_board_table(table, event_type, item)
+            else:
+                stale = True
+    finally:
+        board_cache.missed_events.pop(key, None)
+        board_cache.progress.pop(key, None)
+    logger.info(f"Board {board_id}: {len(table)} sticky notes, {len(table.errors)} tidak valid "
+                f"(+{sync.added} ~{sync.modified} -{len(sync.removed)})")
+    entry = board_cache.put(key, table)
+    if stale:
+        entry.fetched_at = float("-inf")
+    return entry.table
+
+# ------------------ MIRO EVENTS ------------------
+def patch_board_table(table, event_type, item):
+    item_id = item.get("id")
+    row = table.rows.get(item_id)
+    errors = [error for error in table.errors if error[0] != item_id]
+    if row is None:
+        before, after = table, TaskTable()
+    else:
+        before, after = table.take(np.arange(row)), table.take(np.arange(row + 1, len(table)))
+    if event_type == "delete":
+        return TaskTable.concat([before, after], errors=errors)
+    parsed, item_errors = parse_notes_batch([item])
+    return TaskTable.concat([before, parsed, after], errors=errors + item_errors)
+
+def is_patchable_event(event_type, item):
+    return event_type == "delete" or "data" in item
+
+def is_valid_board_event(event):
+    if not isinstance(event, dict) or not isinstance(event.get("boardId") or "", str):
+        return False
+    item = event.get("item") or {}
+    return isinstance(item, dict) and isinstance(item.get("data", {}), dict)
+
+def apply_board_event(event):
+    board_id, event_type, item = event.get("boardId"), event.get("type"), event.get("item") or {}
+    if not board_id or item.get("type") != "sticky_note" or event_type not in ("create", "update", "delete"):
+        return
+    board_cache.subscribed.add(board_id)
+    # Fetch yang sedang berjalan (termasuk load pertama tanpa entry cache) memutar ulang event ini di hasilnya
+    for key in board_cache.loading:
+        if key[1] == board_id:
+            board_cache.missed_events.setdefault(key, []).append((event_type, item))
+    for key, entry in board_cache.board_entries(board_id):
+        if not is_patchable_event(event_type, item):
+            # Payload tanpa konten: biarkan /gantt berikutnya melakukan sync inkremental
+            entry.fetched_at = float("-inf")
+            continue
+        # Tabel lama tetap utuh untuk sesi yang masih memakainya; pilihan dipetakan ulang saat /gantt
+        entry.table = patch_board_table(entry.table, event_type, item)
+    logger.info(f"Event Miro {event_type} untuk item {item.get('id')} di board {board_id}")
 
 # ------------------ CHART GENERATION ------------------
-def generate_chart(data, image_path, excel_path, chart_type="gantt"):
-    df = pd.DataFrame(data)
-    df["Start"] = pd.to_datetime(df["Start"])
-    df["End"] = pd.to_datetime(df["End"])
-    df["Duration"] = (df["End"] - df["Start"]).dt.days
-
-    colors = {"Critical Path": "#FF0000", "Floating Task": "#1E90FF"}
-    start_min, end_max = df["Start"].min(), df["End"].max()
-    total_days = (end_max - start_min).days + 1
-
-    fig, ax = plt.subplots(figsize=(max(10, total_days * 0.3), max(6, len(df) * 0.5)))
-    yticks, ylabels = [], []
-
-    for i, row in df.iterrows():
-        left = row["Start"] if chart_type == "gantt" else i
-        width = row["Duration"] if chart_type == "gantt" else 0.8
-        color = colors.get(row.get("Type"), "#999999")
-
-        ax.barh(i, width, left=left, color=color, edgecolor="black")
-        ax.text(row["End"] + pd.Timedelta(days=1) if chart_type == "gantt" else i + 0.4, i, row["Person"],
-                va="center", fontsize=9)
-        yticks.append(i)
-        ylabels.append(row["Task"])
-
-    ax.set_yticks(yticks)
-    ax.set_yticklabels(ylabels)
-    ax.set_xlabel("Timeline")
-    ax.set_title(chart_type.upper())
-    ax.grid(True, axis='x', linestyle='--', linewidth=0.5)
-    ax.invert_yaxis()
-
-    if chart_type == "gantt":
-        ax.set_xlim(start_min - pd.Timedelta(days=1), end_max + pd.Timedelta(days=2))
-        fig.autofmt_xdate(rotation=45)
-
-    ax.legend(handles=[Patch(facecolor=c, edgecolor='black', label=l) for l, c in colors.items()],
-              loc='upper center', bbox_to_anchor=(0.5, -0.15), ncol=3)
-
-    plt.tight_layout()
-    plt.savefig(image_path)
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Gantt Data"
-    ws.append(["Task", "Start", "End", "Person", "Type"])
-    for row in df.itertuples(index=False):
-        ws.append([row.Task, row.Start.strftime('%Y-%m-%d'), row.End.strftime('%Y-%m-%d'), row.Person, row.Type])
-    wb.save(excel_path)
-
-    return image_path, excel_path
+class ChartRenderer:
+    COLORS = {"Critical Path": "#FF0000", "Floating Task": "#1E90FF"}
+
+    def __init__(self):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        # Satu Figure dipakai ulang per proses, tanpa registry global pyplot
+        self.figure = Figure()
+        FigureCanvasAgg(self.figure)
+
+    def render(self, df, out, chart_type="gantt"):
+        fig = self.figure
+        try:
+            self._draw(fig, df, chart_type)
+            fig.savefig(out, format="png")
+        finally:
+            fig.clear()
+
+    def _draw(self, fig, df, chart_type):
+        from matplotlib import dates as mdates
+        from matplotlib.collections import PolyCollection
+        from matplotlib.patches import Patch
+
+        colors = self.COLORS
+        n = len(df)
+        start_min, end_max = df["Start"].min(), df["End"].max()
+        total_days = (end_max - start_min).days + 1
+
+        width_in = min(max(10, total_days * 0.3), CHART_MAX_INCHES)
+        height_in = min(max(6, n * 0.5), CHART_MAX_INCHES)
+        fig.set_size_inches(width_in, height_in)
+        ax = fig.subplots()
+
+        y = np.arange(n)
+        if chart_type == "gantt":
+            left = mdates.date2num(df["Start"].to_numpy())
+            width = (df["End"] - df["Start"]).dt.days.to_numpy()
+            label_x = mdates.date2num((df["End"] + pd.Timedelta(days=1)).to_numpy())
+        else:
+            left = y.astype(float)
+            width = np.full(n, 0.8)
+            label_x = y + 0.4
+
+        # Semua bar dalam satu PolyCollection, bukan satu artist per task
+        x0, x1, y0, y1 = left, left + width, y - 0.4, y + 0.4
+        verts = np.stack([np.column_stack(corner) for corner in ((x0, y0), (x0, y1), (x1, y1), (x1, y0))], axis=1)
+        facecolors = df["Type"].map(colors).fillna("#999999").to_numpy()
+        ax.add_collection(PolyCollection(verts, facecolors=facecolors, edgecolors="black"))
+        ax.autoscale_view()
+
+        # Ukuran font ikut tinggi baris; label per bar hanya untuk chart yang tidak terlalu besar
+        row_points = height_in / max(n, 1) * 72 * 0.8
+        fontsize = min(9, row_points)
+        tasks = df["Task"].astype(str)
+        if n > CHART_LABEL_LIMIT:
+            tasks = tasks + " · " + df["Person"].astype(str)
+        else:
+            for x_pos, y_pos, person in zip(label_x, y, df["Person"]):
+                ax.text(x_pos, y_pos, person, va="center", fontsize=fontsize)
+        if row_points >= CHART_MIN_FONTSIZE:
+            ax.set_yticks(y, tasks.to_list(), fontsize=min(10, row_points))
+        else:
+            ax.set_yticks([])
+
+        ax.set_xlabel("Timeline")
+        ax.set_title(chart_type.upper())
+        ax.grid(True, axis='x', linestyle='--', linewidth=0.5)
+        ax.invert_yaxis()
+
+        if chart_type == "gantt":
+            ax.xaxis_date()
+            ax.set_xlim(mdates.date2num(start_min - pd.Timedelta(days=1)), mdates.date2num(end_max + pd.Timedelta(days=2)))
+            fig.autofmt_xdate(rotation=45)
+
+        ax.legend(handles=[Patch(facecolor=c, edgecolor='black', label=l) for l, c in colors.items()],
+                  loc='upper center', bbox_to_anchor=(0.5, -0.15), ncol=3)
+        fig.tight_layout()
+
+chart_renderer = None
+
+def render_png(df, out, chart_type):
+    global chart_renderer
+    if chart_renderer is None:
+        chart_renderer = ChartRenderer()
+    chart_renderer.render(df, out, chart_type)
+
+EXPORT_COLUMNS = ["Task", "Start", "End", "Person", "Type"]
+
+def task_rows(df):
+    return zip(df["Task"], df["Start"].dt.date, df["End"].dt.date, df["Person"], df["Type"])
+
+def excel_rows(df):
+    yield EXPORT_COLUMNS
+    # Nilai datetime.date otomatis ditulis openpyxl sebagai sel tanggal berformat yyyy-mm-dd
+    yield from task_rows(df)
+
+def render_excel(df, out, chart_type):
+    from openpyxl import Workbook
+
+    # Mode write-only: baris langsung di-stream ke file, tidak disimpan sebagai objek Cell di memori
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Gantt Data")
+    for row in excel_rows(df):
+        ws.append(row)
+    wb.save(out)
+
+def render_csv(df, out, chart_type):
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="")
+    writer = csv.writer(text)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in task_rows(df):
+        writer.writerow(row)
+    text.flush()
+    text.detach()
+
+def render_jsonl(df, out, chart_type):
+    for task, start, end, person, tipe in task_rows(df):
+        record = {"Task": task, "Start": start.isoformat(), "End": end.isoformat(), "Person": person, "Type": tipe}
+        out.write(json.dumps(record, ensure_ascii=False).encode() + b"\n")
+
+def render_parquet(df, out, chart_type):
+    df[EXPORT_COLUMNS].to_parquet(out, index=False)
+
+# Format output -> (backend, ekstensi file); hanya backend yang dipilih user yang dijalankan
+CHART_BACKENDS = {
+    "png": (render_png, "png"),
+    "excel": (render_excel, "xlsx"),
+    "csv": (render_csv, "csv"),
+    "jsonl": (render_jsonl, "jsonl"),
+}
+# Parquet butuh pyarrow, tombolnya hanya muncul kalau terpasang
+if importlib.util.find_spec("pyarrow"):
+    CHART_BACKENDS["parquet"] = (render_parquet, "parquet")
+
+FORMAT_LABELS = {"png": "🖼 PNG", "excel": "📄 Excel", "csv": "🧾 CSV", "jsonl": "🔣 JSON Lines", "parquet": "🗃 Parquet"}
+
+class ChartOutput:
+    def __init__(self, filename, data=None, path=None):
+        self.filename = filename
+        self.data = data
+        self.path = path
+
+    def open(self):
+        return open(self.path, "rb") if self.path else nullcontext(self.data)
+
+    def digest(self):
+        if self.data is not None:
+            return hashlib.sha256(self.data).hexdigest()
+        digest = hashlib.sha256()
+        with open(self.path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def discard(self):
+        if self.path:
+            os.unlink(self.path)
+            self.path = None
+
+def chart_filename(chart_type, output_format):
+    return f"chart_{chart_type}.{CHART_BACKENDS[output_format][1]}"
+
+def generate_chart(df, output_format, chart_type="gantt"):
+    backend, extension = CHART_BACKENDS[output_format]
+    started = time.perf_counter()
+    buffer = io.BytesIO()
+    backend(df, buffer, chart_type)
+    logger.info(f"Render {output_format} ({chart_type}, {len(df)} task): {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    filename = chart_filename(chart_type, output_format)
+    # Output besar ditulis ke file sementara agar tidak dikirim lewat pipe antar proses
+    if OUTPUT_SPILL_BYTES and buffer.getbuffer().nbytes > OUTPUT_SPILL_BYTES:
+        with tempfile.NamedTemporaryFile(prefix="chart_", suffix=f".{extension}", delete=False) as spill:
+            spill.write(buffer.getbuffer())
+        return ChartOutput(filename, path=spill.name)
+    return ChartOutput(filename, data=buffer.getvalue())
+
+# ------------------ RENDER CACHE ------------------
+def chart_cache_key(df, chart_type, output_format):
+    digest = hashlib.sha256(f"{CHART_STYLE_VERSION}|{chart_type}|{output_format}|".encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+class RenderCache:
+    def __init__(self, max_bytes=RENDER_CACHE_BYTES, disk_dir=RENDER_CACHE_DIR, disk_max_bytes=RENDER_CACHE_DISK_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            return data
+        path = self._disk_path(key)
+        if path and os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            self._put_memory(key, data)
+            return data
+        return None
+
+    def put(self, key, output):
+        if output.data is not None:
+            self._put_memory(key, output.data)
+        path = self._disk_path(key)
+        if path:
+            # Tulis ke file sementara lalu rename, supaya pembaca tidak melihat file setengah jadi
+            with tempfile.NamedTemporaryFile(dir=self.disk_dir, delete=False) as tmp:
+                if output.data is not None:
+                    tmp.write(output.data)
+                else:
+                    with open(output.path, "rb") as f:
+                        shutil.copyfileobj(f, tmp)
+            os.replace(tmp.name, path)
+            self._trim_disk()
+
+    def _put_memory(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.bin") if self.disk_dir else None
+
+    def _trim_disk(self):
+        files = [entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(".bin")]
+        total = sum(entry.stat().st_size for entry in files)
+        for entry in sorted(files, key=lambda e: e.stat().st_mtime):
+            if total <= self.disk_max_bytes:
+                break
+            total -= entry.stat().st_size
+            os.unlink(entry.path)
+
+render_cache = RenderCache()
+
+class FileIdStore:
+    def __init__(self, path=STATE_DB_PATH):
+        self.path = path
+        self._db = None
+        # Dipanggil lewat asyncio.to_thread (lihat file_id_cache), sama seperti SQLiteSessionStore
+        self.lock = threading.Lock()
+
+    @property
+    def db(self):
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.executescript("""
+                PRAGMA journal_mode=WAL;
+                CREATE TABLE IF NOT EXISTS chart_files (digest TEXT PRIMARY KEY, file_id TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS chart_keys (render_key TEXT PRIMARY KEY, digest TEXT NOT NULL);
+            """)
+        return self._db
+
+    def lookup(self, render_key):
+        with self.lock:
+            row = self.db.execute("SELECT f.digest, f.file_id FROM chart_keys k JOIN chart_files f ON f.digest = k.digest "
+                                  "WHERE k.render_key = ?", (render_key,)).fetchone()
+        return row or (None, None)
+
+    def file_id(self, digest):
+        with self.lock:
+            row = self.db.execute("SELECT file_id FROM chart_files WHERE digest = ?", (digest,)).fetchone()
+        return row[0] if row else None
+
+    def remember(self, render_key, digest, file_id=None):
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO chart_keys VALUES (?, ?)", (render_key, digest))
+            if file_id:
+                self.db.execute("INSERT OR REPLACE INTO chart_files VALUES (?, ?)", (digest, file_id))
+
+    def forget(self, digest):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM chart_files WHERE digest = ?", (digest,))
+
+    def close(self):
+        with self.lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+file_id_store = FileIdStore()
+
+async def file_id_cache(method, *args, default=None):
+    # File db dipakai bersama sesi dan proses bot lain: jangan tahan event loop selama busy timeout,
+    # dan kalau db gagal, anggap saja cache miss
+    try:
+        return await asyncio.to_thread(method, *args)
+    except sqlite3.Error as e:
+        logger.warning(f"Cache file_id tidak bisa dipakai: {e!r}")
+        return default
+
+# ------------------ RENDER POOL ------------------
+class RenderQueueFull(Exception):
+    pass
+
+class RenderCancelled(Exception):
+    pass
+
+def warm_render_worker():
+    import matplotlib.figure  # noqa: F401
+    import matplotlib.backends.backend_agg  # noqa: F401
+    import pandas  # noqa: F401
+    import openpyxl  # noqa: F401
+
+class RenderPool:
+    def __init__(self, workers=RENDER_WORKERS, queue_limit=RENDER_QUEUE_LIMIT):
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self._executor = None
+        self._slots = None
+        self._queued = 0
+        self._latest = {}
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=warm_render_worker,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            # Paksa semua worker hidup sekarang, bukan saat chart pertama diminta
+            for _ in range(self.workers):
+                self._executor.submit(os.getpid)
+        return self
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def saturated(self):
+        return self._slots is not None and self._slots.locked()
+
+    def cancel(self, owner):
+        for key in [key for key in self._latest if key[0] == owner]:
+            del self._latest[key]
+
+    async def run(self, key, fn, *args):
+        if self._queued >= self.queue_limit:
+            raise RenderQueueFull()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        self.start()
+
+        # Job lama dengan key yang sama (user, format) otomatis dibatalkan
+        job = self._latest[key] = object()
+        try:
+            self._queued += 1
+            try:
+                await self._slots.acquire()
+            finally:
+                self._queued -= 1
+            try:
+                if self._latest.get(key) is not job:
+                    raise RenderCancelled()
+                result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            finally:
+                self._slots.release()
+            if self._latest.get(key) is not job:
+                if hasattr(result, "discard"):
+                    result.discard()
+                raise RenderCancelled()
+            return result
+        finally:
+            # Juga saat worker gagal, supaya job yang gagal tidak tertinggal di _latest
+            if self._latest.get(key) is job:
+                del self._latest[key]
+
+render_pool = RenderPool()
+
+# ------------------ KEYBOARD EDITS ------------------
+class KeyboardEditor:
+    def __init__(self, delay=KEYBOARD_EDIT_DELAY, max_messages=KEYBOARD_EDIT_CACHE):
+        self.delay = delay
+        self.max_messages = max_messages
+        # Disimpan di modul, bukan di user_data, karena berisi objek query/task yang tidak bisa di-pickle
+        self._sent = OrderedDict()
+        self._pending = {}
+
+    @staticmethod
+    def key(message):
+        return message.chat_id, message.message_id
+
+    async def edit(self, query, text, markup, coalesce=False):
+        key = self.key(query.message)
+        pending = self._pending.get(key)
+        if coalesce:
+            # Toggle beruntun dalam satu jendela cukup dikirim sekali dengan state terakhir
+            if pending:
+                pending[1:] = query, text, markup
+            else:
+                self._pending[key] = [asyncio.create_task(self._flush_later(key)), query, text, markup]
+            return
+        if pending:
+            pending[0].cancel()
+            del self._pending[key]
+        await self._send(key, query, text, markup)
+
+    async def _flush_later(self, key):
+        pending = self._pending[key]
+        while True:
+            # Setiap pengiriman ulang juga menunggu satu jendela agar toggle berikutnya ikut digabung
+            await asyncio.sleep(self.delay)
+            # Entri tetap terdaftar selama edit menunggu rate limiter, jadi toggle baru ikut digabung
+            state = pending[1:]
+            try:
+                await self._send(key, *state)
+            except Exception as e:
+                logger.error(f"Gagal memperbarui keyboard: {e!r}")
+            if pending[1:] == state:
+                del self._pending[key]
+                return
+
+    async def _send(self, key, query, text, markup):
+        if self._sent.get(key) == (text, markup):
+            return
+        try:
+            await query.edit_message_text(text, reply_markup=markup)
+        except BadRequest as e:
+            if "not modified" not in str(e):
+                raise
+        self._sent[key] = (text, markup)
+        self._sent.move_to_end(key)
+        while len(self._sent) > self.max_messages:
+            self._sent.popitem(last=False)
+
+keyboard_editor = KeyboardEditor()
 
 # ------------------ TELEGRAM BOT HANDLERS ------------------
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -107,6 +1115,22 @@ async def handle_text_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["board_id"] = text
         await update.message.reply_text("✅ Board ID disimpan.\nSekarang, kamu bisa jalankan perintah /gantt.")
 
+async def report_board_progress(status, key, load):
+    # Pesan status diperbarui tiap halaman baru masuk (paling sering sekali per BOARD_PROGRESS_INTERVAL)
+    load = asyncio.ensure_future(load)
+    shown = 0
+    while True:
+        done, _ = await asyncio.wait({load}, timeout=BOARD_PROGRESS_INTERVAL)
+        if done:
+            return load.result()
+        fetched = board_cache.progress.get(key, 0)
+        if fetched != shown:
+            shown = fetched
+            try:
+                await status.edit_text(f"⏳ Mengambil sticky notes dari Miro... {fetched} note sudah dimuat")
+            except BadRequest as e:
+                logger.warning(f"Gagal memperbarui progres: {e}")
+
 async def send_gantt(update: Update, context: ContextTypes.DEFAULT_TYPE):
     headers = context.user_data.get("headers")
     board_id = context.user_data.get("board_id")
@@ -114,18 +1138,47 @@ async def send_gantt(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❗ Kamu belum mengirimkan Miro Token atau Board ID. Gunakan /start.")
         return
 
-    notes_raw = fetch_sticky_notes(board_id, headers)
-    notes = [parse_note(n) for n in notes_raw if parse_note(n)]
-    if not notes:
-        await update.message.reply_text("❌ Tidak ada sticky notes yang valid ditemukan.")
+    render_pool.cancel(update.effective_user.id)
+    key = BoardCache.key(context.user_data["miro_token"], board_id)
+    entry = board_cache.get(key)
+    status = None
+    if not (entry and board_cache.is_fresh(key, entry)):
+        # Board besar butuh banyak halaman: user langsung melihat progres, tidak menunggu halaman terakhir
+        status = await update.message.reply_text("⏳ Mengambil sticky notes dari Miro...")
+
+    async def respond(text, **kwargs):
+        if status:
+            await status.edit_text(text, **kwargs)
+        else:
+            await update.message.reply_text(text, **kwargs)
+
+    try:
+        load = load_board_notes(context.user_data["miro_token"], board_id, headers)
+        notes = await (report_board_progress(status, key, load) if status else load)
+    except MiroAPIError as e:
+        logger.error(str(e))
+        await respond("❌ Gagal mengambil data dari Miro. Coba lagi nanti.")
+        return
+    if notes.errors:
+        logger.warning(f"Board {board_id}: {len(notes.errors)} sticky notes dilewati, contoh: {notes.errors[:3]}")
+    if not len(notes):
+        await respond("❌ Tidak ada sticky notes yang valid ditemukan.")
         return
 
+    selected = context.user_data.get("selected_tasks")
+    if selected and context.user_data.get("notes_board_id") == board_id:
+        selected.remap(context.user_data["parsed_notes"], notes)
+    else:
+        context.user_data["selected_tasks"] = TaskSelection(len(notes))
     context.user_data["parsed_notes"] = notes
-    context.user_data["selected_tasks"] = {"Critical Path": set(), "Floating Task": set()}
+    context.user_data["notes_board_id"] = board_id
     context.user_data["current_type"] = "Critical Path"
+    context.user_data["task_page"] = 0
 
-    await update.message.reply_text(
-        "✅ Data berhasil dimuat.\n\nSilakan pilih task berdasarkan kategori *Critical Path* atau *Floating Task*.",
+    skipped = f"\n⚠️ {len(notes.errors)} sticky notes dilewati karena formatnya tidak valid." if notes.errors else ""
+    await respond(
+        "✅ Data berhasil dimuat." + skipped +
+        "\n\nSilakan pilih task berdasarkan kategori *Critical Path* atau *Floating Task*.",
     parse_mode="Markdown"
     )
 
@@ -147,8 +1200,8 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.answer()
     data = query.data
 
-    notes = context.user_data.get("parsed_notes", [])
-    selected = context.user_data.get("selected_tasks", {})
+    notes = context.user_data.get("parsed_notes") or TaskTable()
+    selected = context.user_data.get("selected_tasks") or TaskSelection(len(notes))
     tipe = context.user_data.get("current_type")
 
     if data in ["set_type_critical", "set_type_floating"]:
@@ -156,34 +1209,39 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
         context.user_data["current_type"] = tipe
 
     elif data == "reset_all":
-        selected["Critical Path"].clear()
-        selected["Floating Task"].clear()
+        selected.clear()
+        render_pool.cancel(update.effective_user.id)
         await query.message.reply_text("🔁 Semua pilihan task telah dibatalkan.")
         return
 
     elif data == "done_selecting":
-        summary = [f"*{t}*\n" + "\n".join(f"• {notes[i]['Task']}" for i in ids) if ids else f"*{t}*\n(tidak ada)"
-                   for t, ids in selected.items()]
+        summary = [f"*{t}*\n" + ("\n".join(f"• {notes.task[row]}" for row in selected.rows(t)) or "(tidak ada)")
+                   for t in TaskSelection.TYPES]
         await query.message.reply_text("📋 *Ringkasan task yang dipilih:*\n\n" + "\n\n".join(summary), parse_mode="Markdown")
         keyboard = [[InlineKeyboardButton("✅ Generate Chart", callback_data="generate_chart")]]
         await query.message.reply_text("Lanjutkan ke pembuatan chart:", reply_markup=InlineKeyboardMarkup(keyboard))
         return
 
+    elif data.startswith("page_"):
+        context.user_data["task_page"] = int(data.split("_", 1)[1])
+
     elif data.startswith("toggle_"):
-        idx = int(data.split("_")[1])
+        parts = data.split("_", 2)
+        # Keyboard lama (sebelum ada halaman) masih mengirim toggle_{id}
+        row = notes.rows.get(parts[2]) if len(parts) == 3 and parts[1].isdigit() else None
+        if row is None:
+            await query.answer("Task sudah tidak ada di board. Jalankan /gantt lagi.", show_alert=True)
+            return
+        context.user_data["task_page"] = int(parts[1])
         if not tipe:
             await query.answer("Pilih tipe task dulu!", show_alert=True)
             return
 
-        other = "Floating Task" if tipe == "Critical Path" else "Critical Path"
-        if idx in selected[other]:
+        if selected.type_of(row) not in (None, tipe):
             await query.answer("Task sudah dipilih di tipe lain!", show_alert=True)
             return
 
-        if idx in selected[tipe]:
-            selected[tipe].remove(idx)
-        else:
-            selected[tipe].add(idx)
+        selected.toggle(row, tipe)
 
     elif data == "generate_chart":
         context.user_data["chart_type"] = "gantt"
@@ -194,64 +1252,658 @@ async def handle_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     elif data.startswith("chart_"):
         context.user_data["chart_type"] = data.split("_")[1]
-        keyboard = [[InlineKeyboardButton("🖼 PNG", callback_data="format_png")],
-                    [InlineKeyboardButton("📄 Excel", callback_data="format_excel")]]
+        keyboard = [[InlineKeyboardButton(FORMAT_LABELS[fmt], callback_data=f"format_{fmt}")] for fmt in CHART_BACKENDS]
         await query.message.reply_text("Pilih format output:", reply_markup=InlineKeyboardMarkup(keyboard))
         return
 
     elif data.startswith("format_"):
+        output_format = data.split("_", 1)[1]
+        if output_format not in CHART_BACKENDS:
+            return
         chart_type = context.user_data.get("chart_type", "gantt")
-        selected_notes = []
-        for tipe, ids in selected.items():
-            for idx in ids:
-                note = notes[idx].copy()
-                note["Type"] = tipe
-                selected_notes.append(note)
-
-        if not selected_notes:
+        rows, types = [], []
+        for tipe in TaskSelection.TYPES:
+            # Urutan board, supaya pilihan yang sama selalu menghasilkan chart (dan cache key) yang sama
+            tipe_rows = selected.rows(tipe)
+            rows.extend(tipe_rows)
+            types += [tipe] * len(tipe_rows)
+
+        if not rows:
             await query.message.reply_text("❗ Belum ada task yang dipilih.")
             return
 
-        image, excel = generate_chart(selected_notes, f"chart_{chart_type}.png", f"chart_{chart_type}.xlsx", chart_type)
-        if data.endswith("png"):
-            await query.message.reply_photo(open(image, "rb"), caption=f"{chart_type.upper()} Chart (PNG)")
-        if data.endswith("excel"):
-            await query.message.reply_document(open(excel, "rb"), filename=excel)
+        df = notes.take(rows).to_frame(types)
+        context.application.create_task(
+            send_chart(query.message, update.effective_user.id, df, chart_type, output_format), update=update)
         return
 
     # Show updated task selection
     current = context.user_data.get("current_type", "Critical Path")
+    markup = selection_keyboard(notes, selected, current, context.user_data.get("task_page", 0))
+    await keyboard_editor.edit(query, "Pilih task yang termasuk dalam kategori: *" + current + "*", markup,
+                               coalesce=data.startswith("toggle_"))
+
+def selection_keyboard(notes, selected, current, page):
+    # Hanya satu halaman yang dikirim; halaman ikut di callback_data (toggle_{page}_{id}, page_{n})
+    pages = max(1, -(-len(notes) // TASKS_PER_PAGE))
+    page = min(max(page, 0), pages - 1)
+    first = page * TASKS_PER_PAGE
     keyboard = []
-    for idx, note in enumerate(notes):
-        label = note["Task"]
-        if idx in selected["Critical Path"]:
+    for row in range(first, min(first + TASKS_PER_PAGE, len(notes))):
+        idx, label = notes.ids[row], notes.task[row]
+        selected_type = selected.type_of(row)
+        if selected_type == "Critical Path":
             label = "🔴 " + label
-        elif idx in selected["Floating Task"]:
+        elif selected_type == "Floating Task":
             label = "🔵 " + label
 
-        if idx in selected["Critical Path"] and current == "Floating Task" or \
-           idx in selected["Floating Task"] and current == "Critical Path":
+        if selected_type not in (None, current):
             button = InlineKeyboardButton(f"❌ {label}", callback_data="noop")
         else:
-            button = InlineKeyboardButton(label, callback_data=f"toggle_{idx}")
+            button = InlineKeyboardButton(label, callback_data=f"toggle_{page}_{idx}")
         keyboard.append([button])
 
+    if pages > 1:
+        keyboard.append([InlineKeyboardButton("◀️", callback_data=f"page_{page - 1}" if page > 0 else "noop"),
+                         InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="noop"),
+                         InlineKeyboardButton("▶️", callback_data=f"page_{page + 1}" if page < pages - 1 else "noop")])
     keyboard += [[InlineKeyboardButton("✔️ Selesai", callback_data="done_selecting"),
                   InlineKeyboardButton("🔁 Reset", callback_data="reset_all")],
                  [InlineKeyboardButton("🔴 Critical", callback_data="set_type_critical"),
                   InlineKeyboardButton("🔵 Floating", callback_data="set_type_floating")]]
-    await query.edit_message_text("Pilih task yang termasuk dalam kategori: *" + current + "*", reply_markup=InlineKeyboardMarkup(keyboard))
+    return InlineKeyboardMarkup(keyboard)
+
+async def save_user_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Grup handler terakhir: sesi dijadwalkan ditulis setelah user diam, di bawah kunci per user yang sama
+    if update.effective_user and context.application.persistence:
+        context.application.persistence.schedule_save(update.effective_user.id, context.user_data,
+                                                      getattr(context.application.update_processor, "user_lock", None))
+
+async def reply_chart(message, content, chart_type, output_format, filename):
+    if output_format == "png":
+        sent = await message.reply_photo(content, caption=f"{chart_type.upper()} Chart (PNG)", filename=filename)
+        return sent.photo[-1].file_id
+    sent = await message.reply_document(content, filename=filename)
+    return sent.document.file_id
+
+async def send_by_file_id(message, digest, file_id, chart_type, output_format, filename):
+    try:
+        await reply_chart(message, file_id, chart_type, output_format, filename)
+        return True
+    except BadRequest as e:
+        logger.warning(f"file_id tersimpan tidak valid, upload ulang: {e}")
+        await file_id_cache(file_id_store.forget, digest)
+        return False
+
+async def send_chart(message, owner, df, chart_type, output_format):
+    key = chart_cache_key(df, chart_type, output_format)
+    filename = chart_filename(chart_type, output_format)
+
+    # Chart yang sama persis sudah pernah diupload (oleh chat mana pun): kirim lewat file_id
+    digest, file_id = await file_id_cache(file_id_store.lookup, key, default=(None, None))
+    if file_id and await send_by_file_id(message, digest, file_id, chart_type, output_format, filename):
+        return
+
+    data = render_cache.get(key)
+    if data is not None:
+        output = ChartOutput(filename, data=data)
+    else:
+        # Hanya diberitahu kalau chart benar-benar harus antre di render pool
+        if render_pool.saturated:
+            await message.reply_text("⏳ Chart kamu sedang disiapkan, mohon tunggu sebentar...")
+        try:
+            output = await render_pool.run((owner, output_format), generate_chart, df, output_format, chart_type)
+        except RenderCancelled:
+            return
+        except RenderQueueFull:
+            await message.reply_text("❗ Server sedang sibuk membuat chart lain. Coba lagi sebentar lagi.")
+            return
+        except Exception as e:
+            logger.error(f"Gagal membuat chart {chart_type} ({output_format}): {e!r}")
+            await message.reply_text("❌ Gagal membuat chart. Coba lagi nanti.")
+            return
+        render_cache.put(key, output)
+
+    try:
+        digest = output.digest()
+        file_id = await file_id_cache(file_id_store.file_id, digest)
+        if file_id and await send_by_file_id(message, digest, file_id, chart_type, output_format, filename):
+            await file_id_cache(file_id_store.remember, key, digest)
+            return
+        with output.open() as content:
+            file_id = await reply_chart(message, content, chart_type, output_format, filename)
+        await file_id_cache(file_id_store.remember, key, digest, file_id)
+    finally:
+        output.discard()
+
+# ------------------ SESSION STORAGE ------------------
+class SessionStore:
+    # Antarmuka key-value dengan versi (compare-and-set) supaya backend lain, mis. Redis WATCH/MULTI, bisa dipasang
+    def version(self, key):
+        raise NotImplementedError
+
+    def load(self, key):
+        raise NotImplementedError
+
+    # Simpan hanya kalau versi tersimpan masih expected_version; kembalikan versi baru, atau None kalau bentrok
+    def save(self, key, data, expected_version):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path=STATE_DB_PATH):
+        # Dipanggil lewat asyncio.to_thread, jadi koneksi dipakai dari beberapa thread secara bergantian
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.lock = threading.Lock()
+        self.db.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, version INTEGER NOT NULL, data BLOB NOT NULL);
+        """)
+
+    def version(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT version FROM sessions WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def load(self, key):
+        with self.lock:
+            return self.db.execute("SELECT version, data FROM sessions WHERE key = ?", (key,)).fetchone() or (None, None)
+
+    def save(self, key, data, expected_version):
+        with self.lock, self.db:
+            if expected_version is None:
+                cursor = self.db.execute("INSERT OR IGNORE INTO sessions VALUES (?, 1, ?)", (key, data))
+            else:
+                cursor = self.db.execute("UPDATE sessions SET data = ?, version = version + 1 WHERE key = ? AND version = ?",
+                                         (data, key, expected_version))
+        if not cursor.rowcount:
+            return None
+        return 1 if expected_version is None else expected_version + 1
+
+    def delete(self, key):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def merge_session(base, ours, theirs):
+    # Key yang diubah sesi ini ditimpakan ke versi terbaru; pilihan task pada board yang sama digabung per baris
+    merged = dict(theirs)
+    for key in ours.keys() | base.keys():
+        if key not in ours:
+            merged.pop(key, None)
+            continue
+        value = ours[key]
+        if key in base and pickle.dumps(value) == pickle.dumps(base[key]):
+            continue
+        if isinstance(value, TaskSelection) and ours.get("notes_board_id") == theirs.get("notes_board_id"):
+            value = value.merged(base.get(key), theirs.get(key))
+        merged[key] = value
+    return merged
+
+class SessionPersistence(BasePersistence):
+    def __init__(self, store, write_retries=SESSION_WRITE_RETRIES, flush_delay=SESSION_FLUSH_DELAY,
+                 max_loaded=SESSION_CACHE_SIZE):
+        super().__init__(store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False))
+        self.store = store
+        self.write_retries = write_retries
+        self.flush_delay = flush_delay
+        self.max_loaded = max_loaded
+        # user_id -> (versi, blob) terakhir yang dibaca/ditulis worker ini, LRU
+        self._loaded = OrderedDict()
+        # user_id -> [task, user_data] untuk sesi yang berubah tapi belum ditulis
+        self._pending = {}
+
+    @staticmethod
+    def key(user_id):
+        return f"user:{user_id}"
+
+    @staticmethod
+    def dumps(data):
+        return zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def loads(blob):
+        return pickle.loads(zlib.decompress(blob)) if blob else {}
+
+    def _remember(self, user_id, version, blob):
+        self._loaded[user_id] = version, blob
+        self._loaded.move_to_end(user_id)
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+
+    # User data dimuat lazy lewat refresh_user_data, jadi beberapa worker bisa berbagi satu store
+    async def get_user_data(self):
+        return {}
+
+    def _read(self, key):
+        version, blob = self.store.load(key)
+        return version, blob, self.loads(blob)
+
+    async def refresh_user_data(self, user_id, user_data):
+        key = self.key(user_id)
+        version = await asyncio.to_thread(self.store.version, key)
+        loaded = self._loaded.get(user_id)
+        if version is None or loaded and loaded[0] == version:
+            return
+        if user_id in self._pending:
+            # Worker lain menulis selagi perubahan di sini belum disimpan: tulis sekarang (digabung), jangan ditimpa
+            self._pending.pop(user_id)[0].cancel()
+            await self.save_user_data(user_id, user_data)
+            return
+        version, blob, data = await asyncio.to_thread(self._read, key)
+        user_data.clear()
+        user_data.update(data)
+        self._remember(user_id, version, blob)
+
+    def schedule_save(self, user_id, data, user_lock=None):
+        # Debounce: toggle beruntun cukup ditulis sekali setelah user diam selama flush_delay
+        pending = self._pending.get(user_id)
+        if pending:
+            pending[0].cancel()
+        self._pending[user_id] = [asyncio.create_task(self._save_later(user_id, data, user_lock)), data]
+
+    async def _save_later(self, user_id, data, user_lock):
+        await asyncio.sleep(self.flush_delay)
+        # Ditulis di bawah kunci per user, jadi tidak pernah di tengah update user yang sama
+        async with user_lock(user_id) if user_lock else nullcontext():
+            del self._pending[user_id]
+            try:
+                await self.save_user_data(user_id, data)
+            except Exception as e:
+                logger.error(f"Gagal menyimpan sesi user {user_id}: {e!r}")
+
+    def _write(self, key, data, version, base):
+        # Jalan di thread: pickle + kompresi seluruh sesi (termasuk TaskTable board) terlalu berat untuk event loop
+        blob, merged = self.dumps(data), None
+        for _ in range(self.write_retries):
+            if blob == base:
+                return version, base, merged
+            saved = self.store.save(key, blob, version)
+            if saved is not None:
+                return saved, blob, merged
+            # Worker lain menulis lebih dulu: muat versi terbaru, gabungkan perubahan sesi ini, lalu coba lagi
+            version, latest = self.store.load(key)
+            merged = merge_session(self.loads(base), data if merged is None else merged, self.loads(latest))
+            base, blob = latest, self.dumps(merged)
+        return None
+
+    async def save_user_data(self, user_id, data):
+        version, base = self._loaded.get(user_id, (None, None))
+        result = await asyncio.to_thread(self._write, self.key(user_id), dict(data), version, base)
+        if result is None:
+            logger.warning(f"Sesi user {user_id} gagal disimpan setelah {self.write_retries} kali bentrok")
+            return
+        version, blob, merged = result
+        if merged is not None:
+            data.clear()
+            data.update(merged)
+        self._remember(user_id, version, blob)
+
+    async def update_user_data(self, user_id, data):
+        # Sesi dijadwalkan oleh save_user_session begitu update user selesai, bukan oleh timer PTB
+        pass
+
+    async def drop_user_data(self, user_id):
+        pending = self._pending.pop(user_id, None)
+        if pending:
+            pending[0].cancel()
+        self._loaded.pop(user_id, None)
+        await asyncio.to_thread(self.store.delete, self.key(user_id))
+
+    async def flush(self):
+        # Saat shutdown tidak ada update lagi, jadi sesi yang masih tertunda ditulis langsung
+        for user_id in list(self._pending):
+            task, data = self._pending.pop(user_id)
+            task.cancel()
+            await self.save_user_data(user_id, data)
+        await asyncio.to_thread(self.store.close)
+
+    async def get_chat_data(self):
+        return {}
+
+    async def get_bot_data(self):
+        return {}
+
+    async def get_callback_data(self):
+        return None
+
+    async def get_conversations(self, name):
+        return {}
+
+    async def update_chat_data(self, chat_id, data):
+        pass
+
+    async def update_bot_data(self, data):
+        pass
+
+    async def update_callback_data(self, data):
+        pass
+
+    async def update_conversation(self, name, key, new_state):
+        pass
+
+    async def drop_chat_data(self, chat_id):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+# ------------------ OUTBOUND RATE LIMIT ------------------
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._timer = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return now
+
+    @property
+    def idle(self):
+        self._refill()
+        return not self._waiters and self.tokens >= self.capacity
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, priority=1):
+        now = self._refill()
+        if not self._waiters and self.tokens >= 1 and now >= self.paused_until:
+            self.tokens -= 1
+            return
+        # Antrian per prioritas: angka kecil dilayani lebih dulu, urutan datang dijaga dalam satu prioritas
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        self._schedule()
+        await future
+
+    def _schedule(self):
+        if self._timer is not None or not self._waiters:
+            return
+        now = time.monotonic()
+        delay = max(self.paused_until - now, (1 - self.tokens) / self.rate, 0)
+        self._timer = asyncio.get_running_loop().call_later(delay, self._release)
+
+    def _release(self):
+        self._timer = None
+        now = self._refill()
+        while self._waiters and self.tokens >= 1 and now >= self.paused_until:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.tokens -= 1
+                future.set_result(None)
+        self._schedule()
+
+class OutboundRateLimiter(BaseRateLimiter):
+    # Jawaban callback dan edit keyboard didahulukan, upload file paling belakang
+    PRIORITIES = {"answerCallbackQuery": 0, "editMessageText": 0, "editMessageReplyMarkup": 0,
+                  "sendPhoto": 2, "sendDocument": 2}
+    UPLOAD_FIELDS = ("photo", "document")
+
+    def __init__(self, global_rate=TELEGRAM_GLOBAL_RATE, chat_rate=TELEGRAM_CHAT_RATE, chat_burst=TELEGRAM_CHAT_BURST,
+                 group_rate=TELEGRAM_GROUP_RATE, upload_concurrency=TELEGRAM_UPLOAD_CONCURRENCY,
+                 max_retries=TELEGRAM_MAX_RETRIES):
+        self.global_bucket = TokenBucket(global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.upload_concurrency = upload_concurrency
+        self.max_retries = max_retries
+        self._chat_buckets = {}
+        self._uploads = None
+
+    async def initialize(self):
+        self._uploads = asyncio.Semaphore(self.upload_concurrency)
+
+    async def shutdown(self):
+        self._chat_buckets.clear()
+
+    def chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= 10000:
+                self._chat_buckets = {key: b for key, b in self._chat_buckets.items() if not b.idle}
+            # chat_id negatif = grup/channel, batas Telegram jauh lebih ketat
+            group = str(chat_id).startswith("-")
+            bucket = TokenBucket(self.group_rate, 1) if group else TokenBucket(self.chat_rate, self.chat_burst)
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        priority = self.PRIORITIES.get(endpoint, 1)
+        chat_id = data.get("chat_id") if endpoint != "answerCallbackQuery" else None
+        upload = any(isinstance(data.get(field), InputFile) for field in self.UPLOAD_FIELDS)
+        for attempt in range(self.max_retries + 1):
+            if chat_id is not None:
+                await self.chat_bucket(chat_id).acquire(priority)
+            await self.global_bucket.acquire(priority)
+            try:
+                async with self._uploads if upload else nullcontext():
+                    return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+                logger.warning(f"Telegram membatasi {endpoint}, coba lagi dalam {retry_after} detik")
+                (self.chat_bucket(chat_id) if chat_id is not None else self.global_bucket).pause(retry_after)
+
+# ------------------ UPDATE PROCESSING ------------------
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    def __init__(self, max_concurrent_updates=UPDATE_CONCURRENCY):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}
+        self._waiters = {}
+
+    @staticmethod
+    def ordering_key(update):
+        if not isinstance(update, Update):
+            return None
+        if update.effective_user:
+            return "user", update.effective_user.id
+        if update.effective_chat:
+            return "chat", update.effective_chat.id
+        return None
+
+    @asynccontextmanager
+    async def exclusive(self, key):
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                del self._locks[key]
+
+    # Dipakai juga oleh SessionPersistence supaya sesi tidak ditulis di tengah update user yang sama
+    def user_lock(self, user_id):
+        return self.exclusive(("user", user_id))
+
+    async def process_update(self, update, coroutine):
+        key = self.ordering_key(update)
+        if key is None:
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+            return
+
+        # Update dari user yang sama diproses berurutan, antar user tetap paralel.
+        # Kunci per user diambil sebelum slot global, jadi antrian satu user hanya memakai satu slot
+        async with self.exclusive(key), self._semaphore:
+            await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
 
 # ------------------ MAIN FUNCTION ------------------
+async def post_init(application):
+    render_pool.start()
+    # Mode webhook sudah melayani event Miro di server yang sama
+    if BOT_MODE != "webhook" and MIRO_WEBHOOK_PORT:
+        if MIRO_WEBHOOK_SECRET:
+            miro_event_server.start()
+        else:
+            logger.warning("MIRO_WEBHOOK_SECRET belum diisi, event Miro tidak diterima")
+
+async def post_shutdown(application):
+    await miro_event_server.stop()
+    render_pool.shutdown()
+    file_id_store.close()
+    await miro_client.aclose()
+
+def miro_event_routes():
+    from starlette.responses import JSONResponse, Response
+    from starlette.routing import Route
+
+    async def miro_event(request):
+        # Event mengubah tabel board yang dipakai bersama semua user, jadi tanpa secret endpoint ditolak
+        if not MIRO_WEBHOOK_SECRET:
+            return Response(status_code=403)
+        body = await request.body()
+        signature = hmac.new(MIRO_WEBHOOK_SECRET.encode(), body, hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(signature, request.headers.get("X-Miro-Signature", "")):
+            return Response(status_code=403)
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return Response(status_code=400)
+        if not isinstance(payload, dict):
+            return Response(status_code=400)
+        # Verifikasi saat subscription dibuat: Miro mengharapkan challenge dikembalikan apa adanya
+        if "challenge" in payload:
+            return JSONResponse({"challenge": payload["challenge"]})
+        event = payload.get("event")
+        if event is not None:
+            if not is_valid_board_event(event):
+                return Response(status_code=400)
+            apply_board_event(event)
+        return Response()
+
+    return [Route(MIRO_WEBHOOK_PATH, miro_event, methods=["POST"])]
+
+class MiroEventServer:
+    # Penerima event Miro terpisah untuk mode polling; mode webhook memakai server Telegram yang sama
+    def __init__(self, host=WEBHOOK_LISTEN, port=MIRO_WEBHOOK_PORT):
+        self.host = host
+        self.port = port
+        self._server = None
+        self._task = None
+
+    def start(self):
+        import uvicorn
+        from starlette.applications import Starlette
+
+        class EmbeddedServer(uvicorn.Server):
+            # Sinyal sudah ditangani run_polling
+            def install_signal_handlers(self):
+                pass
+
+            def capture_signals(self):
+                return nullcontext()
+
+        self._server = EmbeddedServer(uvicorn.Config(Starlette(routes=miro_event_routes()), host=self.host,
+                                                     port=self.port, log_level="warning"))
+        self._task = asyncio.create_task(self._server.serve())
+
+    async def stop(self):
+        if self._task is not None:
+            self._server.should_exit = True
+            await self._task
+            self._server = self._task = None
+
+miro_event_server = MiroEventServer()
+
+def build_webhook_app(application):
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse, Response
+    from starlette.routing import Route
+
+    async def telegram_update(request):
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return Response(status_code=403)
+        await application.update_queue.put(Update.de_json(await request.json(), application.bot))
+        return Response()
+
+    async def health(request):
+        return PlainTextResponse("ok")
+
+    return Starlette(routes=[
+        Route(WEBHOOK_PATH, telegram_update, methods=["POST"]),
+        Route("/healthz", health, methods=["GET"]),
+        *miro_event_routes(),
+    ])
+
+async def run_webhook(application):
+    import uvicorn
+
+    class WebhookServer(uvicorn.Server):
+        # uvicorn mengirim ulang SIGTERM setelah berhenti, proses mati sebelum application.stop dan flush sesi.
+        # Sinyal ditangani sendiri lewat event loop di bawah
+        def capture_signals(self):
+            return nullcontext()
+
+    server = WebhookServer(uvicorn.Config(build_webhook_app(application), host=WEBHOOK_LISTEN, port=WEBHOOK_PORT,
+                                          limit_concurrency=WEBHOOK_CONCURRENCY, log_level="warning"))
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, server.handle_exit, sig, None)
+    async with application:
+        await post_init(application)
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH, secret_token=WEBHOOK_SECRET,
+                                              max_connections=WEBHOOK_MAX_CONNECTIONS, allowed_updates=Update.ALL_TYPES)
+        await application.start()
+        try:
+            await server.serve()
+        finally:
+            await application.stop()
+            await post_shutdown(application)
+
 def main():
-    application = ApplicationBuilder().token(TELEGRAM_TOKEN).build()
+    builder = (ApplicationBuilder().token(TELEGRAM_TOKEN).concurrent_updates(PerUserUpdateProcessor())
+               .persistence(SessionPersistence(SQLiteSessionStore()))
+               .rate_limiter(OutboundRateLimiter())
+               .post_init(post_init).post_shutdown(post_shutdown))
+    if TELEGRAM_API_URL:
+        builder = builder.base_url(TELEGRAM_API_URL)
+    application = builder.build()
 
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("gantt", send_gantt))
     application.add_handler(CallbackQueryHandler(handle_buttons))
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_input))
+    application.add_handler(TypeHandler(Update, save_user_session), group=1)
 
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        asyncio.run(run_webhook(application))
+    else:
+        application.run_polling()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_addoption(parser):
+    parser.addoption("--runslow", action="store_true", help="jalankan juga test lambat (soak test)")
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "slow: test lama, hanya jalan dengan --runslow")
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption("--runslow"):
+        return
+    skip = pytest.mark.skip(reason="butuh --runslow")
+    for item in items:
+        if "slow" in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,52 @@
+import asyncio
+from types import SimpleNamespace
+
+import gantt_bot
+from gantt_bot import TaskSelection, TaskTable, handle_buttons
+
+NOTES = TaskTable(ids=["11", "12"], task=["A", "B"], start=[0, 0], end=[1, 1], person=["P", "P"],
+                  color=["", ""], modified=["m", "m"])
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.message = SimpleNamespace(chat_id=1, message_id=1, reply_text=self.reply_text)
+        self.alerts = []
+        self.replies = []
+
+    async def answer(self, text=None, show_alert=False):
+        if text:
+            self.alerts.append(text)
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def press(data, user_data):
+    query = FakeQuery(data)
+    tasks = []
+    application = SimpleNamespace(create_task=lambda coroutine, update=None: tasks.append(coroutine) or coroutine.close())
+    update = SimpleNamespace(callback_query=query, effective_user=SimpleNamespace(id=1))
+    context = SimpleNamespace(user_data=user_data, application=application)
+    asyncio.run(handle_buttons(update, context))
+    return query, tasks
+
+
+def session():
+    selected = TaskSelection(len(NOTES))
+    selected.toggle(0, "Critical Path")
+    return {"parsed_notes": NOTES, "selected_tasks": selected, "current_type": "Critical Path"}
+
+
+def test_toggle_from_keyboard_without_page_asks_to_rerun_gantt():
+    user_data = session()
+    query, _ = press("toggle_12", user_data)
+    assert query.alerts == ["Task sudah tidak ada di board. Jalankan /gantt lagi."]
+    assert list(user_data["selected_tasks"].rows("Critical Path")) == [0]
+
+
+def test_unknown_format_is_ignored_before_any_reply(monkeypatch):
+    monkeypatch.setattr(gantt_bot.render_pool, "_slots", SimpleNamespace(locked=lambda: True))
+    query, tasks = press("format_pdf", session())
+    assert query.replies == [] and tasks == []
@@ -0,0 +1,47 @@
+import io
+import os
+
+import pandas as pd
+import pytest
+
+from gantt_bot import ChartRenderer
+
+WARMUP = 10
+# Batas pertumbuhan RSS setelah pemanasan; figure yang bocor (registry pyplot) jauh melewatinya
+RSS_GROWTH_LIMIT = 20 * 1024 * 1024
+
+
+def rss_bytes():
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pytest.skip("RSS hanya bisa dibaca lewat /proc")
+
+
+def chart_frame(tasks=12):
+    return pd.DataFrame({
+        "Task": [f"Task {i}" for i in range(tasks)],
+        "Start": pd.date_range("2024-01-01", periods=tasks, freq="D"),
+        "End": pd.date_range("2024-01-05", periods=tasks, freq="D"),
+        "Person": ["Ana", "Budi", "Caca"] * (tasks // 3),
+        "Color": [""] * tasks,
+        "Type": ["Critical Path", "Floating Task"] * (tasks // 2),
+    })
+
+
+@pytest.mark.parametrize("renders", [pytest.param(30, id="quick"),
+                                     pytest.param(10_000, marks=pytest.mark.slow, id="soak")])
+def test_repeated_renders_keep_rss_flat(renders):
+    renderer = ChartRenderer()
+    df = chart_frame()
+    for _ in range(WARMUP):
+        renderer.render(df, io.BytesIO(), "gantt")
+    baseline = peak = rss_bytes()
+    for index in range(renders):
+        # Bergantian gantt/timeline supaya ukuran figure ikut berubah
+        renderer.render(df, io.BytesIO(), "gantt" if index % 2 else "timeline")
+        if index % 50 == 0:
+            peak = max(peak, rss_bytes())
+    peak = max(peak, rss_bytes())
+    assert peak - baseline < RSS_GROWTH_LIMIT
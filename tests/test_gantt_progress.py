@@ -0,0 +1,62 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+import gantt_bot
+from gantt_bot import BoardCache, MiroClient, send_gantt
+
+PAGES = 3
+PAGE_SIZE = 10
+
+
+class StatusMessage:
+    def __init__(self, events, text):
+        self.events = events
+        self.events.append(("reply", text))
+
+    async def edit_text(self, text, **kwargs):
+        self.events.append(("edit", text))
+
+
+def test_progress_is_shown_before_the_last_page_arrives(monkeypatch):
+    events = []
+
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        page = int(request.url.params.get("cursor", 0))
+        events.append(("page", page))
+        notes = [{"id": f"{page}-{i}", "type": "sticky_note", "modifiedAt": "2024-05-01T10:00:00Z",
+                  "data": {"content": f"<p>Task {i} | 2024-01-01 | 2024-01-05 | <span>Ana</span></p>"}}
+                 for i in range(PAGE_SIZE)]
+        return httpx.Response(200, json={"data": notes, "cursor": str(page + 1) if page + 1 < PAGES else None})
+
+    async def reply_text(text, **kwargs):
+        return StatusMessage(events, text)
+
+    async def scenario():
+        client = MiroClient(base_url="http://miro")
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://miro")
+        monkeypatch.setattr(gantt_bot, "miro_client", client)
+        update = SimpleNamespace(update_id=1, message=SimpleNamespace(reply_text=reply_text),
+                                 effective_user=SimpleNamespace(id=1))
+        context = SimpleNamespace(user_data={"miro_token": "token", "board_id": "b1",
+                                             "headers": {"Authorization": "Bearer token"}})
+        try:
+            await send_gantt(update, context)
+        finally:
+            await client.aclose()
+        return context.user_data
+
+    monkeypatch.setattr(gantt_bot, "board_cache", BoardCache())
+    monkeypatch.setattr(gantt_bot, "BOARD_PROGRESS_INTERVAL", 0.01)
+    monkeypatch.setattr(gantt_bot, "handle_buttons", lambda update, context: asyncio.sleep(0))
+    user_data = asyncio.run(scenario())
+
+    assert len(user_data["parsed_notes"]) == PAGES * PAGE_SIZE
+    assert events[0] == ("reply", "⏳ Mengambil sticky notes dari Miro...")
+    last_page = events.index(("page", PAGES - 1))
+    progress = [text for kind, text in events[:last_page] if kind == "edit"]
+    assert progress and progress[-1].endswith(f"{(PAGES - 1) * PAGE_SIZE} note sudah dimuat")
+    assert events[-1][0] == "edit" and events[-1][1].startswith("✅ Data berhasil dimuat.")
+    assert not any(kind == "reply" for kind, _ in events[1:])
@@ -0,0 +1,32 @@
+import asyncio
+from types import SimpleNamespace
+
+from gantt_bot import KeyboardEditor
+
+
+class SlowQuery:
+    def __init__(self, edits, latency):
+        self.message = SimpleNamespace(chat_id=1, message_id=1)
+        self.edits = edits
+        self.latency = latency
+
+    async def edit_message_text(self, text, reply_markup=None):
+        await asyncio.sleep(self.latency)
+        self.edits.append(text)
+
+
+def test_rapid_toggles_are_coalesced_per_window():
+    async def scenario():
+        editor = KeyboardEditor(delay=0.12)
+        edits = []
+        for tap in range(10):
+            await editor.edit(SlowQuery(edits, latency=0.1), f"state {tap}", None, coalesce=True)
+            await asyncio.sleep(0.05)
+        while editor._pending:
+            await asyncio.sleep(0.05)
+        return edits
+
+    edits = asyncio.run(scenario())
+    # Tanpa jeda di antara pengiriman ulang setiap edit yang selesai langsung memicu edit berikutnya (5 edit)
+    assert len(edits) <= 3
+    assert edits[-1] == "state 9"
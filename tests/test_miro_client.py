@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import httpx
+
+from gantt_bot import MiroClient
+
+HEADERS = {"Authorization": "Bearer token"}
+
+
+def run_client(handler, paths):
+    state = {"active": 0, "peak": 0, "requests": 0}
+
+    async def transport_handler(request):
+        state["requests"] += 1
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            await asyncio.sleep(0.02)
+            return handler(request)
+        finally:
+            state["active"] -= 1
+
+    async def scenario():
+        client = MiroClient(base_url="http://miro", retry_base=0.01)
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(transport_handler), base_url="http://miro")
+        try:
+            return await asyncio.gather(*(client.get(path, HEADERS) for path in paths))
+        finally:
+            await client.aclose()
+
+    return asyncio.run(scenario()), state
+
+
+def test_without_rate_limit_headers_requests_run_concurrently():
+    responses, state = run_client(lambda request: httpx.Response(200, json={}), [f"/boards/{i}/items" for i in range(10)])
+    assert all(response.status_code == 200 for response in responses)
+    assert state["peak"] > 1
+
+
+def test_budget_from_headers_is_respected():
+    def handler(request):
+        return httpx.Response(200, json={}, headers={"X-RateLimit-Remaining": "100",
+                                                     "X-RateLimit-Reset": str(time.time() + 0.3)})
+
+    start = time.monotonic()
+    _, state = run_client(handler, [f"/boards/{i}/items" for i in range(4)])
+    # Probe + 2 request dalam jendela pertama (100 kredit / 50), sisanya menunggu reset
+    assert state["requests"] == 4
+    assert time.monotonic() - start >= 0.25
+
+
+def test_identical_gets_are_deduplicated():
+    _, state = run_client(lambda request: httpx.Response(200, json={}), ["/boards/1/items"] * 5)
+    assert state["requests"] == 1
+
+
+def test_retries_transient_errors():
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        return httpx.Response(503 if len(attempts) < 3 else 200, json={})
+
+    responses, _ = run_client(handler, ["/boards/1/items"])
+    assert responses[0].status_code == 200
+    assert len(attempts) == 3
+
+
+def test_idle_token_budgets_are_evicted():
+    def handler(request):
+        if request.headers["Authorization"] == "Bearer limited":
+            return httpx.Response(200, json={}, headers={"X-RateLimit-Remaining": "0",
+                                                         "X-RateLimit-Reset": str(time.time() + 60)})
+        return httpx.Response(200, json={})
+
+    async def scenario():
+        client = MiroClient(base_url="http://miro", max_budgets=3)
+        client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler), base_url="http://miro")
+        await client.get("/boards/1/items", {"Authorization": "Bearer limited"})
+        for user in range(10):
+            await client.get("/boards/1/items", {"Authorization": f"Bearer user{user}"})
+        await client.aclose()
+        return client
+
+    client = asyncio.run(scenario())
+    assert len(client._budgets) <= 3
+    # Budget yang masih menunggu reset kuota tidak boleh dibuang
+    assert MiroClient.token_key({"Authorization": "Bearer limited"}) in client._budgets
@@ -0,0 +1,144 @@
+import asyncio
+import hashlib
+import hmac
+import json
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+
+import gantt_bot
+from gantt_bot import BoardCache, load_board_notes, miro_event_routes
+
+BOARD = "uXjVboard="
+SECRET = "s3cret"
+HEADERS = {"Authorization": "Bearer token"}
+
+
+def note(item_id, text, modified="2024-05-01T10:00:00Z"):
+    return {"id": item_id, "type": "sticky_note", "modifiedAt": modified,
+            "data": {"content": f"<p>{text}</p>"}, "style": {"fillColor": "light_yellow"}}
+
+
+BOARD_ITEMS = [note(str(i), f"Task {i} | 2024-01-0{i + 1} | 2024-02-01 | Ana") for i in range(3)]
+
+
+def event(event_type, item):
+    return {"type": "event", "event": {"boardId": BOARD, "type": event_type, "item": item}}
+
+
+class MiroReplayer:
+    """Mengirim payload webhook Miro ke app ASGI lokal, tanpa Miro sungguhan."""
+
+    def __init__(self, secret=SECRET):
+        self.secret = secret
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=Starlette(routes=miro_event_routes())),
+                                        base_url="http://bot")
+
+    async def send(self, payload, secret=None):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        headers = {"content-type": "application/json"}
+        secret = secret or self.secret
+        if secret:
+            headers["X-Miro-Signature"] = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+        return await self.client.post(gantt_bot.MIRO_WEBHOOK_PATH, content=body, headers=headers)
+
+
+@pytest.fixture
+def board(monkeypatch):
+    monkeypatch.setattr(gantt_bot, "MIRO_WEBHOOK_SECRET", SECRET)
+    monkeypatch.setattr(gantt_bot, "board_cache", BoardCache(ttl=0))
+    state = {"requests": 0, "release": None}
+
+    async def pages(board_id, headers):
+        state["requests"] += 1
+        if state["release"] is not None:
+            await state["release"].wait()
+        yield [dict(item) for item in BOARD_ITEMS]
+
+    monkeypatch.setattr(gantt_bot, "iter_sticky_note_pages", pages)
+    return state
+
+
+def test_challenge_and_signature(monkeypatch):
+    monkeypatch.setattr(gantt_bot, "MIRO_WEBHOOK_SECRET", SECRET)
+
+    async def scenario():
+        replayer = MiroReplayer()
+        assert (await replayer.send({"challenge": "abc"})).json() == {"challenge": "abc"}
+        assert (await replayer.send({"challenge": "abc"}, secret="salah")).status_code == 403
+
+    asyncio.run(scenario())
+
+
+def test_events_are_rejected_without_configured_secret(board, monkeypatch):
+    monkeypatch.setattr(gantt_bot, "MIRO_WEBHOOK_SECRET", None)
+
+    async def scenario():
+        await load_board_notes("token", BOARD, HEADERS)
+        response = await MiroReplayer(secret=None).send(event("delete", {"id": "1", "type": "sticky_note"}))
+        return response, await load_board_notes("token", BOARD, HEADERS)
+
+    response, table = asyncio.run(scenario())
+    assert response.status_code == 403
+    assert list(table.ids) == ["0", "1", "2"]
+    assert BOARD not in gantt_bot.board_cache.subscribed
+
+
+@pytest.mark.parametrize("payload", [b"{bukan json", b"\xff", b"[]", json.dumps({"event": "x"}).encode(),
+                                     json.dumps(event("update", ["bukan", "dict"])).encode(),
+                                     json.dumps(event("update", {"id": "0", "type": "sticky_note", "data": 1})).encode()])
+def test_malformed_payload_is_bad_request(board, payload):
+    response = asyncio.run(MiroReplayer().send(payload))
+    assert response.status_code == 400
+
+
+def test_events_patch_cached_board_without_refetch(board):
+    async def scenario():
+        replayer = MiroReplayer()
+        await load_board_notes("token", BOARD, HEADERS)
+        await replayer.send(event("update", note("0", "Renamed | 2024-03-01 | 2024-03-05 | Budi")))
+        await replayer.send(event("delete", {"id": "1", "type": "sticky_note"}))
+        await replayer.send(event("create", note("9", "Baru | 2024-04-01 | 2024-04-02 | Caca")))
+        await replayer.send(event("create", note("8", "tanpa kolom")))
+        await replayer.send(event("create", {"id": "7", "type": "shape", "data": {}}))
+        return await load_board_notes("token", BOARD, HEADERS)
+
+    table = asyncio.run(scenario())
+    assert board["requests"] == 1
+    assert list(table.ids) == ["0", "2", "9"]
+    assert table.task[0] == "Renamed"
+    assert [error[0] for error in table.errors] == ["8"]
+
+
+def test_events_during_first_load_are_replayed(board):
+    async def scenario():
+        replayer = MiroReplayer()
+        board["release"] = asyncio.Event()
+        load = asyncio.create_task(load_board_notes("token", BOARD, HEADERS))
+        await asyncio.sleep(0)
+        await replayer.send(event("update", note("0", "Renamed | 2024-03-01 | 2024-03-05 | Budi")))
+        await replayer.send(event("delete", {"id": "1", "type": "sticky_note"}))
+        board["release"].set()
+        await load
+        return await load_board_notes("token", BOARD, HEADERS)
+
+    table = asyncio.run(scenario())
+    assert board["requests"] == 1
+    assert list(table.ids) == ["0", "2"]
+    assert table.task[0] == "Renamed"
+
+
+def test_event_without_content_during_load_forces_refetch(board):
+    async def scenario():
+        replayer = MiroReplayer()
+        board["release"] = asyncio.Event()
+        load = asyncio.create_task(load_board_notes("token", BOARD, HEADERS))
+        await asyncio.sleep(0)
+        await replayer.send(event("update", {"id": "0", "type": "sticky_note"}))
+        board["release"].set()
+        await load
+        await load_board_notes("token", BOARD, HEADERS)
+
+    asyncio.run(scenario())
+    assert board["requests"] == 2
@@ -0,0 +1,93 @@
+import asyncio
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import gantt_bot
+from gantt_bot import BoardCache, MiroClient, load_board_notes
+
+USERS = 40
+BOARDS = 4
+NOTES_PER_BOARD = 100
+MIRO_LATENCY = 1.0
+
+
+def board_items(board_id):
+    return [{"id": f"{board_id}-{i}", "type": "sticky_note", "modifiedAt": "2024-05-01T10:00:00Z",
+             "data": {"content": f"<p>Task {i} | 2024-01-01 | 2024-01-05 | <span>Ana</span></p>"},
+             "style": {"fillColor": "light_yellow"}} for i in range(NOTES_PER_BOARD)]
+
+
+@pytest.fixture
+def fake_miro(monkeypatch):
+    """Miro tiruan yang lambat di uvicorn sungguhan, di thread terpisah dari event loop bot."""
+    stats = {"requests": 0, "active": 0, "peak": 0}
+    boards = {f"board{i}": board_items(f"board{i}") for i in range(BOARDS)}
+
+    async def items(request):
+        stats["requests"] += 1
+        stats["active"] += 1
+        stats["peak"] = max(stats["peak"], stats["active"])
+        try:
+            await asyncio.sleep(MIRO_LATENCY)
+        finally:
+            stats["active"] -= 1
+        notes = boards[request.path_params["board_id"]]
+        limit, offset = int(request.query_params["limit"]), int(request.query_params.get("cursor", 0))
+        cursor = offset + limit if offset + limit < len(notes) else None
+        return JSONResponse({"data": notes[offset:offset + limit], "cursor": cursor and str(cursor)})
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(Starlette(routes=[Route("/v2/boards/{board_id}/items", items)]),
+                                           log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    monkeypatch.setattr(gantt_bot, "miro_client", MiroClient(base_url=f"http://127.0.0.1:{sock.getsockname()[1]}/v2"))
+    monkeypatch.setattr(gantt_bot, "board_cache", BoardCache())
+    yield stats
+    server.should_exit = True
+    thread.join()
+
+
+def test_many_users_load_boards_without_blocking_the_loop(fake_miro):
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        gaps, done = [], False
+
+        async def heartbeat():
+            # Mewakili callback user lain: harus tetap jalan selama Miro lambat
+            last = loop.time()
+            while not done:
+                await asyncio.sleep(0.005)
+                now = loop.time()
+                gaps.append(now - last)
+                last = now
+
+        beat = asyncio.create_task(heartbeat())
+        started = loop.time()
+        tables = await asyncio.gather(*(
+            load_board_notes(f"token{user}", f"board{user % BOARDS}", {"Authorization": f"Bearer token{user}"})
+            for user in range(USERS)))
+        elapsed = loop.time() - started
+        done = True
+        await beat
+        await gantt_bot.miro_client.aclose()
+        return tables, elapsed, max(gaps)
+
+    tables, elapsed, max_gap = asyncio.run(scenario())
+    assert all(len(table) == NOTES_PER_BOARD and not table.errors for table in tables)
+    # Dua halaman per user; dijalankan berurutan butuh USERS * 2 * MIRO_LATENCY = 80 detik
+    assert elapsed < USERS * 2 * MIRO_LATENCY / 8
+    assert fake_miro["requests"] == USERS * 2
+    assert fake_miro["peak"] >= USERS // 2
+    # Client yang memblokir akan menahan loop sepanjang latensi Miro di setiap request
+    assert max_gap < MIRO_LATENCY / 2
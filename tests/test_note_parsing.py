@@ -0,0 +1,46 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from gantt_bot import note_content_text, parse_note_dates, parse_notes_batch
+
+# pasangan (konten note, hasil BeautifulSoup(content, "lxml").get_text())
+NOTE_CONTENT_CORPUS = json.loads((Path(__file__).parent / "note_content_corpus.json").read_text(encoding="utf-8"))
+
+
+def note(item_id, content):
+    return {"id": item_id, "modifiedAt": "2024-05-01T10:00:00Z", "data": {"content": content}}
+
+
+def test_dates_with_timezone_keep_local_date():
+    dates = parse_note_dates(["2024-01-01", "2024-01-01T10:00:00Z", "2024-01-02T01:00:00+07:00", "01/02/2024"])
+    assert list(dates) == list(np.array(["2024-01-01", "2024-01-01", "2024-01-02", "2024-01-02"], dtype="datetime64[D]"))
+
+
+def test_invalid_dates_are_reported_not_raised():
+    table, errors = parse_notes_batch([
+        note("1", "A | 2024-01-01T10:00:00Z | 2024-01-03 | Ana"),
+        note("2", "B | bukan tanggal | 2024-01-03 | Budi"),
+        note("3", "C | 2024-01-01 | 2024-13-45 | Caca"),
+        note("4", "D | 2024-01-01"),
+    ])
+    assert list(table.ids) == ["1"]
+    assert [error[0] for error in errors] == ["4", "2", "3"]
+
+
+@pytest.mark.parametrize("content,expected", NOTE_CONTENT_CORPUS)
+def test_note_content_text_matches_lxml(content, expected):
+    assert note_content_text(content) == expected
+
+
+def test_bad_style_is_reported_per_note():
+    table, errors = parse_notes_batch([
+        {**note("1", "A | 2024-01-01 | 2024-01-03 | Ana"), "style": None},
+        {**note("2", "B | 2024-01-01 | 2024-01-03 | Budi"), "style": "kuning"},
+        {**note("3", "C | 2024-01-01 | 2024-01-03 | Caca"), "style": {"fillColor": "red"}},
+    ])
+    assert list(table.ids) == ["1", "3"]
+    assert list(table.color) == ["", "red"]
+    assert [error[0] for error in errors] == ["2"]
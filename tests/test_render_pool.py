@@ -0,0 +1,103 @@
+import asyncio
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import gantt_bot
+from gantt_bot import ChartOutput, FileIdStore, RenderCache, RenderPool
+
+
+def failing_render(*args):
+    raise ValueError("render rusak")
+
+
+def thread_pool():
+    pool = RenderPool(workers=1)
+    # Thread cukup untuk test; proses spawn hanya memperlambat
+    pool._executor = ThreadPoolExecutor(max_workers=1)
+    return pool
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+        self.photos = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+    async def reply_photo(self, photo, **kwargs):
+        self.photos.append(photo)
+        return SimpleNamespace(photo=[SimpleNamespace(file_id="file-1")])
+
+
+class LockedFileIdStore(FileIdStore):
+    @property
+    def db(self):
+        raise sqlite3.OperationalError("database is locked")
+
+
+def test_failed_render_is_removed_from_latest():
+    pool = thread_pool()
+    with pytest.raises(ValueError):
+        asyncio.run(pool.run((1, "png"), failing_render))
+    assert pool._latest == {}
+
+
+def test_send_chart_reports_render_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(gantt_bot, "render_pool", thread_pool())
+    monkeypatch.setattr(gantt_bot, "render_cache", RenderCache(disk_dir=None))
+    monkeypatch.setattr(gantt_bot, "file_id_store", FileIdStore(tmp_path / "state.db"))
+    monkeypatch.setattr(gantt_bot, "generate_chart", failing_render)
+    df = pd.DataFrame({"Task": ["A"], "Start": ["2024-01-01"], "End": ["2024-01-02"]})
+    message = FakeMessage()
+
+    asyncio.run(gantt_bot.send_chart(message, 1, df, "gantt", "png"))
+    assert message.replies == ["❌ Gagal membuat chart. Coba lagi nanti."]
+    assert gantt_bot.render_pool._latest == {}
+
+
+def test_send_chart_treats_file_id_db_errors_as_cache_miss(tmp_path, monkeypatch):
+    monkeypatch.setattr(gantt_bot, "render_pool", thread_pool())
+    monkeypatch.setattr(gantt_bot, "render_cache", RenderCache(disk_dir=None))
+    monkeypatch.setattr(gantt_bot, "file_id_store", LockedFileIdStore(tmp_path / "state.db"))
+    monkeypatch.setattr(gantt_bot, "generate_chart", lambda df, output_format, chart_type: ChartOutput("c.png", data=b"png"))
+    df = pd.DataFrame({"Task": ["A"], "Start": ["2024-01-01"], "End": ["2024-01-02"]})
+    message = FakeMessage()
+
+    asyncio.run(gantt_bot.send_chart(message, 1, df, "gantt", "png"))
+    assert len(message.photos) == 1
+    assert message.replies == []
+
+
+def test_busy_notice_only_when_render_has_to_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(gantt_bot, "render_pool", thread_pool())
+    monkeypatch.setattr(gantt_bot, "render_cache", RenderCache(disk_dir=None))
+    monkeypatch.setattr(gantt_bot, "file_id_store", FileIdStore(tmp_path / "state.db"))
+    monkeypatch.setattr(gantt_bot, "generate_chart", lambda df, output_format, chart_type: ChartOutput("c.png", data=b"png"))
+    busy = "⏳ Chart kamu sedang disiapkan, mohon tunggu sebentar..."
+
+    async def scenario():
+        pool = gantt_bot.render_pool
+        pool._slots = asyncio.Semaphore(1)
+        await pool._slots.acquire()
+        queued = FakeMessage()
+        first = pd.DataFrame({"Task": ["A"], "Start": ["2024-01-01"], "End": ["2024-01-02"]})
+        job = asyncio.create_task(gantt_bot.send_chart(queued, 1, first, "gantt", "png"))
+        await asyncio.sleep(0.05)
+        notified_while_busy = list(queued.replies)
+        pool._slots.release()
+        await job
+        # Chart yang sama sekarang ada di cache: tidak perlu antre, jadi tanpa pemberitahuan
+        await pool._slots.acquire()
+        cached = FakeMessage()
+        await gantt_bot.send_chart(cached, 2, first, "gantt", "png")
+        pool._slots.release()
+        return notified_while_busy, queued, cached
+
+    notified_while_busy, queued, cached = asyncio.run(scenario())
+    assert notified_while_busy == [busy] and len(queued.photos) == 1
+    assert cached.replies == [] and len(cached.photos) == 1
@@ -0,0 +1,131 @@
+import asyncio
+
+from gantt_bot import PerUserUpdateProcessor, SessionPersistence, SQLiteSessionStore, TaskSelection, TaskTable
+
+NOTES = TaskTable(ids=["a", "b", "c", "d"], task=["A", "B", "C", "D"], start=[0] * 4, end=[1] * 4,
+                  person=["P"] * 4, color=[""] * 4, modified=["m"] * 4)
+
+
+class CountingStore(SQLiteSessionStore):
+    def __init__(self, path):
+        super().__init__(path)
+        self.saves = 0
+
+    def save(self, key, data, expected_version):
+        self.saves += 1
+        return super().save(key, data, expected_version)
+
+
+def session():
+    return {"board_id": "b1", "notes_board_id": "b1", "parsed_notes": NOTES,
+            "selected_tasks": TaskSelection(len(NOTES)), "current_type": "Critical Path"}
+
+
+def test_session_is_written_immediately_and_shared(tmp_path):
+    async def scenario():
+        first = SessionPersistence(SQLiteSessionStore(tmp_path / "state.db"))
+        second = SessionPersistence(SQLiteSessionStore(tmp_path / "state.db"))
+        data = session()
+        data["selected_tasks"].toggle(2, "Critical Path")
+        await first.save_user_data(1, data)
+        loaded = {}
+        await second.refresh_user_data(1, loaded)
+        return loaded
+
+    loaded = asyncio.run(scenario())
+    assert list(loaded["selected_tasks"].rows("Critical Path")) == [2]
+
+
+def test_concurrent_workers_do_not_lose_toggles(tmp_path):
+    async def scenario():
+        workers = [SessionPersistence(SQLiteSessionStore(tmp_path / "state.db")) for _ in range(3)]
+        views = [session()]
+        await workers[0].save_user_data(1, views[0])
+        for worker in workers[1:]:
+            view = {}
+            await worker.refresh_user_data(1, view)
+            views.append(view)
+        # Setiap worker memegang versi yang sama lalu menulis toggle berbeda
+        views[0]["selected_tasks"].toggle(0, "Critical Path")
+        views[1]["selected_tasks"].toggle(1, "Floating Task")
+        views[2]["selected_tasks"].toggle(3, "Critical Path")
+        views[2]["current_type"] = "Floating Task"
+        await asyncio.gather(*(worker.save_user_data(1, view) for worker, view in zip(workers, views)))
+        reader = SessionPersistence(SQLiteSessionStore(tmp_path / "state.db"))
+        result = {}
+        await reader.refresh_user_data(1, result)
+        return result
+
+    result = asyncio.run(scenario())
+    assert list(result["selected_tasks"].rows("Critical Path")) == [0, 3]
+    assert list(result["selected_tasks"].rows("Floating Task")) == [1]
+    assert result["current_type"] == "Floating Task"
+
+
+def test_rapid_changes_are_written_once_after_idle_window(tmp_path):
+    async def scenario():
+        store = CountingStore(tmp_path / "state.db")
+        persistence = SessionPersistence(store, flush_delay=0.05)
+        data = session()
+        for row in range(4):
+            data["selected_tasks"].toggle(row, "Critical Path")
+            persistence.schedule_save(1, data)
+            await asyncio.sleep(0.01)
+        assert store.saves == 0
+        await asyncio.sleep(0.15)
+        loaded = {}
+        await SessionPersistence(SQLiteSessionStore(tmp_path / "state.db")).refresh_user_data(1, loaded)
+        return store.saves, loaded
+
+    saves, loaded = asyncio.run(scenario())
+    assert saves == 1
+    assert list(loaded["selected_tasks"].rows("Critical Path")) == [0, 1, 2, 3]
+
+
+def test_pending_write_waits_for_user_lock(tmp_path):
+    async def scenario():
+        store = CountingStore(tmp_path / "state.db")
+        persistence = SessionPersistence(store, flush_delay=0.01)
+        processor = PerUserUpdateProcessor()
+        async with processor.user_lock(1):
+            persistence.schedule_save(1, session(), processor.user_lock)
+            await asyncio.sleep(0.05)
+            during_update = store.saves
+        await asyncio.sleep(0.05)
+        return during_update, store.saves
+
+    assert asyncio.run(scenario()) == (0, 1)
+
+
+def test_pending_changes_survive_write_from_other_worker(tmp_path):
+    async def scenario():
+        first = SessionPersistence(SQLiteSessionStore(tmp_path / "state.db"), flush_delay=60)
+        second = SessionPersistence(SQLiteSessionStore(tmp_path / "state.db"))
+        ours = session()
+        await first.save_user_data(1, ours)
+        theirs = {}
+        await second.refresh_user_data(1, theirs)
+        ours["selected_tasks"].toggle(0, "Critical Path")
+        first.schedule_save(1, ours)
+        theirs["selected_tasks"].toggle(1, "Floating Task")
+        await second.save_user_data(1, theirs)
+        # Update berikutnya di worker pertama: perubahan tertunda digabung, bukan ditimpa versi worker lain
+        await first.refresh_user_data(1, ours)
+        result = {}
+        await SessionPersistence(SQLiteSessionStore(tmp_path / "state.db")).refresh_user_data(1, result)
+        return ours, result
+
+    ours, result = asyncio.run(scenario())
+    for data in (ours, result):
+        assert list(data["selected_tasks"].rows("Critical Path")) == [0]
+        assert list(data["selected_tasks"].rows("Floating Task")) == [1]
+
+
+def test_loaded_versions_are_bounded(tmp_path):
+    async def scenario():
+        persistence = SessionPersistence(SQLiteSessionStore(tmp_path / "state.db"), max_loaded=2)
+        for user_id in range(3):
+            await persistence.save_user_data(user_id, session())
+        return list(persistence._loaded)
+
+    assert asyncio.run(scenario()) == [1, 2]
@@ -0,0 +1,90 @@
+import asyncio
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update, User
+
+from gantt_bot import OutboundRateLimiter, PerUserUpdateProcessor, TokenBucket
+
+
+def update_from(update_id, user_id):
+    message = Message(update_id, datetime.now(timezone.utc), Chat(user_id, Chat.PRIVATE),
+                      from_user=User(user_id, "tester", False))
+    return Update(update_id, message=message)
+
+
+def test_updates_from_one_user_run_in_order_others_in_parallel():
+    async def scenario():
+        processor = PerUserUpdateProcessor(max_concurrent_updates=8)
+        finished = []
+
+        async def handle(user_id, step, delay):
+            await asyncio.sleep(delay)
+            finished.append((user_id, step))
+
+        # Update pertama user 1 paling lambat; kalau tidak berurutan, step 2 selesai lebih dulu
+        jobs = [(1, 0, 0.06), (1, 1, 0.03), (1, 2, 0.01), (2, 0, 0.01)]
+        await asyncio.gather(*(processor.process_update(update_from(index, user_id), handle(user_id, step, delay))
+                               for index, (user_id, step, delay) in enumerate(jobs)))
+        return finished, processor
+
+    finished, processor = asyncio.run(scenario())
+    assert [step for user_id, step in finished if user_id == 1] == [0, 1, 2]
+    # User 2 tidak menunggu antrian user 1
+    assert finished[0] == (2, 0)
+    assert processor._locks == {} and processor._waiters == {}
+
+
+def test_backlog_of_one_user_does_not_hold_global_slots():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        processor = PerUserUpdateProcessor(max_concurrent_updates=2)
+        started = loop.time()
+        done_at = {}
+
+        async def handle(user_id, delay):
+            await asyncio.sleep(delay)
+            done_at.setdefault(user_id, loop.time() - started)
+
+        # User 1 menumpuk empat update lambat sebelum user 2 mengirim update cepat
+        updates = [processor.process_update(update_from(index, 1), handle(1, 0.2)) for index in range(4)]
+        updates.append(processor.process_update(update_from(4, 2), handle(2, 0)))
+        await asyncio.gather(*updates)
+        return done_at
+
+    assert asyncio.run(scenario())[2] < 0.1
+
+
+def test_token_bucket_serves_lower_priority_number_first():
+    async def scenario():
+        bucket = TokenBucket(rate=50)
+        await bucket.acquire()
+        served = []
+
+        async def request(priority, index):
+            await bucket.acquire(priority)
+            served.append((priority, index))
+
+        await asyncio.gather(*(request(priority, index) for index, priority in enumerate([2, 1, 0, 2, 0, 1])))
+        return served
+
+    # Prioritas sama tetap dilayani sesuai urutan datang
+    assert asyncio.run(scenario()) == [(0, 2), (0, 4), (1, 1), (1, 5), (2, 0), (2, 3)]
+
+
+def test_rate_limiter_sends_callback_answers_before_uploads():
+    async def scenario():
+        limiter = OutboundRateLimiter(global_rate=50, chat_burst=10)
+        await limiter.initialize()
+        await limiter.global_bucket.acquire()
+        sent = []
+
+        async def call(endpoint):
+            sent.append(endpoint)
+
+        requests = [("sendDocument", {"chat_id": 7}), ("sendMessage", {"chat_id": 7}),
+                    ("answerCallbackQuery", {"callback_query_id": "q"})]
+        await asyncio.gather(*(limiter.process_request(call, (endpoint,), {}, endpoint, data, None)
+                               for endpoint, data in requests))
+        return sent
+
+    assert asyncio.run(scenario()) == ["answerCallbackQuery", "sendMessage", "sendDocument"]